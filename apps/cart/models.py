@@ -5,6 +5,12 @@ from ..products.models import Product, ProductSize
 from django.core.exceptions import ValidationError
 
 
+class CartQuerySet(models.QuerySet):
+    def with_checkout_items(self):
+        """Prefetch items with their product and size, so totals, stock deduction and the order snapshot share one query."""
+        return self.prefetch_related(models.Prefetch("cartitem_cart", queryset=CartItem.objects.select_related("product", "size")))
+
+
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="cart_user")
@@ -18,6 +24,8 @@ class Cart(models.Model):
     estimated_delivery = models.CharField(max_length=100, null=True, blank=True)
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart - {self.id} - {self.user.email}"
 
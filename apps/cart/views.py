@@ -1,10 +1,11 @@
-import json
 
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.core.cache import cache
+from config.cache_keys import query_cache_key, admit_variant
+from config.response_cache import cached_response
 from .models import Cart, CartItem
 from .permissions import IsAuthenticatedAndCartItemOwner
 from .serializers import CartSerializer, CartItemSerializer, CartItemSerializerView, CartSerializerView, PatchCartSerializer
@@ -33,47 +34,34 @@ class ApiCart(viewsets.ModelViewSet):
 
     @swagger_helper("Cart", "cart")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"cart_list:{request.user.id}:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "cart_list", request.user.id)
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"cart:{request.user.id}", "carts"], admit=lambda: admit_variant(request, self, "cart_list", request.user.id))
 
     @swagger_helper("Cart", "cart")
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
-        cache.delete_pattern(f"cart_list:{request.user.id}:*")
+        cache.invalidate_tags([f"cart:{request.user.id}"])
         return response
 
     @swagger_helper("Cart", "cart")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"cart_detail:{request.user.id}:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"cart:{request.user.id}", "carts"])
 
     @swagger_helper("Cart", "cart")
     def partial_update(self, request, *args, **kwargs):
         response = super().partial_update(request, *args, **kwargs)
-        cache.delete_pattern(f"cart_list:{request.user.id}:*")
-        cache.delete_pattern(f"cart_detail:{request.user.id}:{kwargs['pk']}")
+        cache.invalidate_tags([f"cart:{request.user.id}"])
         return response
 
     @swagger_helper("Cart", "cart")
     def destroy(self, request, *args, **kwargs):
         response = super().destroy(request, *args, **kwargs)
-        cache.delete_pattern(f"cart_list:{request.user.id}:*")
-        cache.delete_pattern(f"cart_detail:{request.user.id}:{kwargs['pk']}")
+        cache.invalidate_tags([f"cart:{request.user.id}"])
         return response
 
     def perform_create(self, serializer):
@@ -100,16 +88,10 @@ class ApiCartItem(viewsets.ModelViewSet):
 
     @swagger_helper("CartItem", "cart item")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"cart_item_list:{request.user.id}:{self.kwargs.get('cart_pk')}:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "cart_item_list", request.user.id, self.kwargs.get('cart_pk'))
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"cart:{request.user.id}", "carts"], admit=lambda: admit_variant(request, self, "cart_item_list", request.user.id))
 
     @swagger_helper("CartItem", "cart item")
     def create(self, request, *args, **kwargs):
@@ -137,22 +119,16 @@ class ApiCartItem(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             serializer.save(quantity=quantity, cart=cart)
-            cache.delete_pattern(f"cart_item_list:{request.user.id}:*")
-            cache.delete_pattern(f"cart_list:{request.user.id}:*")
+            cache.invalidate_tags([f"cart:{request.user.id}"])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @swagger_helper("CartItem", "cart item")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"cart_item_detail:{request.user.id}:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"cart:{request.user.id}", "carts"])
 
     @swagger_helper("CartItem", "cart item")
     def partial_update(self, request, *args, **kwargs):
@@ -202,9 +178,7 @@ class ApiCartItem(viewsets.ModelViewSet):
 
         if response_messages:
             cart_item.save()
-            cache.delete_pattern(f"cart_item_list:{request.user.id}:*")
-            cache.delete_pattern(f"cart_item_detail:{request.user.id}:{kwargs['pk']}")
-            cache.delete_pattern(f"cart_list:{request.user.id}:*")
+            cache.invalidate_tags([f"cart:{request.user.id}"])
             return Response({"message": " ".join(response_messages)}, status=status.HTTP_200_OK)
 
         return Response({"message": "No changes made."}, status=status.HTTP_200_OK)
@@ -212,7 +186,5 @@ class ApiCartItem(viewsets.ModelViewSet):
     @swagger_helper("CartItem", "cart item")
     def destroy(self, request, *args, **kwargs):
         response = super().destroy(request, *args, **kwargs)
-        cache.delete_pattern(f"cart_item_list:{request.user.id}:*")
-        cache.delete_pattern(f"cart_item_detail:{request.user.id}:{kwargs['pk']}")
-        cache.delete_pattern(f"cart_list:{request.user.id}:*")
+        cache.invalidate_tags([f"cart:{request.user.id}"])
         return response
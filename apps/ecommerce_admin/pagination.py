@@ -1,8 +1,8 @@
-from rest_framework.pagination import PageNumberPagination
 from drf_yasg import openapi
+from config.pagination import OptionalKeysetPagination
 
 
-class CustomPagination(PageNumberPagination):
+class CustomPagination(OptionalKeysetPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
@@ -19,5 +19,17 @@ PAGINATION_PARAMS = [
         openapi.IN_QUERY,
         description="Items per page (max: 100)",
         type=openapi.TYPE_INTEGER
-    )
+    ),
+    openapi.Parameter(
+        'pagination',
+        openapi.IN_QUERY,
+        description="Set to 'cursor' for keyset pagination on listings that support it",
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        'cursor',
+        openapi.IN_QUERY,
+        description="Opaque cursor from a keyset-paginated response's next/previous link",
+        type=openapi.TYPE_STRING
+    ),
 ]
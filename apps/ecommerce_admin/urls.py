@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ApiAdminOrder, OrderDashboard, ApiOrganizationSettings, ApiDeliverySettings, ApiDeveloperSettings
+from .views import ApiAdminOrder, OrderDashboard, ApiOrganizationSettings, ApiDeliverySettings, ApiDeveloperSettings, ApiCacheMetrics, \
+    ApiCatalogImport, ApiCatalogExport, ApiWebhookMetrics, ApiPaymentProviderMetrics
 
 router = DefaultRouter()
 router.register("order", ApiAdminOrder, basename="admin_order_page")
@@ -11,4 +12,10 @@ urlpatterns = [
     path('organisation-settings/', ApiOrganizationSettings.as_view({'get': 'list', 'patch': 'partial_update'}), name='admin_settings'),
     path('delivery-settings/', ApiDeliverySettings.as_view({'get': 'list', 'patch': 'partial_update'}), name='delivery_settings'),
     path('developer-settings/', ApiDeveloperSettings.as_view({'get': 'list', 'patch': 'partial_update'}), name='developer_settings'),
+    path('cache-metrics/', ApiCacheMetrics.as_view({'get': 'list', 'delete': 'destroy'}), name='cache_metrics'),
+    path('payment-provider-metrics/', ApiPaymentProviderMetrics.as_view({'get': 'list', 'delete': 'destroy'}), name='payment_provider_metrics'),
+    path('webhook-metrics/', ApiWebhookMetrics.as_view({'get': 'list'}), name='webhook_metrics'),
+    path('catalog-import/', ApiCatalogImport.as_view({'post': 'create'}), name='catalog_import'),
+    path('catalog-import/<str:pk>/', ApiCatalogImport.as_view({'get': 'retrieve'}), name='catalog_import_status'),
+    path('catalog-export/', ApiCatalogExport.as_view({'get': 'list'}), name='catalog_export'),
 ]
@@ -7,7 +7,12 @@ from .tasks import (send_refund_initiated_notification_email, is_celery_healthy,
                     refund_confirmation_email, send_order_shipped_email, send_order_delivered_email,
                     send_shipped_email_synchronously, send_delivered_email_synchronously)
 from django.utils.functional import SimpleLazyObject
+from django.core.files.storage import default_storage
+import uuid
 from ..ecommerce_admin.models import OrganizationSettings, DeveloperSettings
+from ..products.catalog import run_stored_import, set_import_status
+from ..products.tasks import import_catalog_task
+from ..payment.providers import get_provider
 
 ADMIN_EMAIL = SimpleLazyObject(
     lambda: getattr(OrganizationSettings.objects.first(), 'admin_email', None))
@@ -31,36 +36,14 @@ def swagger_helper(tags, model):
 
 
 def initiate_refund(order):
+    if order.payment_provider not in settings.PAYMENT_PROVIDERS:
+        return False
     try:
-        if order.payment_provider == "paystack":
-            payload = {"transaction": order.transaction_id}
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['paystack']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            response = requests.post(
-                "https://api.paystack.co/refund",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            notify_admin_for_refund_initiated(order)
-            notify_user_for_refunded_order(order)
-            return True
-        elif order.payment_provider == "flutterwave":
-            if not order.transaction_id:
-                return False
-            url = f"https://api.flutterwave.com/v3/transactions/{order.transaction_id}/refund"
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['flutterwave']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            payload = {}
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            notify_admin_for_refund_initiated(order)
-            notify_user_for_refunded_order(order)
-            return True
+        if not get_provider(order.payment_provider).refund(order.transaction_id):
+            return False
+        notify_admin_for_refund_initiated(order)
+        notify_user_for_refunded_order(order)
+        return True
     except requests.exceptions.RequestException:
         return False
 
@@ -170,3 +153,21 @@ def notify_user_for_delivered_order(order):
                 'delivery_date': delivery_date
             }
         )
+
+
+def start_catalog_import(upload, file_format):
+    job_id = uuid.uuid4().hex
+    path = default_storage.save(f"catalog_imports/{job_id}.{file_format}", upload)
+    set_import_status(job_id, "queued")
+
+    if not is_celery_healthy():
+        run_stored_import(path, file_format, job_id)
+    else:
+        import_catalog_task.apply_async(
+            kwargs={
+                'path': path,
+                'file_format': file_format,
+                'job_id': job_id
+            }
+        )
+    return job_id
@@ -5,9 +5,11 @@ from .models import OrganizationSettings, DeliverySettings, DeveloperSettings
 from .serializers import PatchOrderSerializer, DeveloperSettingsSerializer, DeliverySettingsSerializer, OrganizationSettingsSerializer
 from ..orders.serializers import OrderSerializer
 from ..orders.models import Order
+from ..payment.models import WebhookEvent
+from ..payment.client import metrics as provider_metrics
 from rest_framework import viewsets, status, mixins
 from .pagination import CustomPagination
-from .utils import swagger_helper, initiate_refund, notify_user_for_shipped_order, notify_user_for_delivered_order
+from .utils import swagger_helper, initiate_refund, notify_user_for_shipped_order, notify_user_for_delivered_order, start_catalog_import
 from .filters import OrderFilter
 from ..products.models import ProductSize
 from django.utils import timezone
@@ -17,6 +19,10 @@ from drf_yasg.utils import swagger_auto_schema
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from apps.products.models import Product
+from apps.products.catalog import FORMATS, export_catalog, import_status
+from django.http import StreamingHttpResponse
+from drf_yasg import openapi
+from rest_framework.parsers import MultiPartParser
 from django.db.models.functions import TruncMonth
 from rest_framework import viewsets
 from datetime import date, timedelta
@@ -86,6 +92,7 @@ class ApiAdminOrder(viewsets.ModelViewSet):
     filterset_class = OrderFilter
     ordering_fields = ['order_date', 'total_amount', 'delivery_date']
     ordering = ['-order_date', '-created_at']
+    keyset_ordering = ['-order_date', '-created_at', 'id']
     search_fields = ["id", "status", "payment_provider"]
 
     def get_serializer_class(self):
@@ -172,12 +179,8 @@ class ApiAdminOrder(viewsets.ModelViewSet):
                         else:
                             return Response({"error": "Product not found."}, status=status.HTTP_400_BAD_REQUEST)
 
-                    cache.delete_pattern("product_list:*")
-                    for product_id in product_ids:
-                        cache.delete_pattern(f"product_detail:{product_id}")
-                    cache.delete_pattern("product_suggestions:*")
-                    cache.delete_pattern("search:*")
-                    cache.delete_pattern("search_suggestions:*")
+                    cache.invalidate_tags([f"product:{product_id}" for product_id in product_ids])
+                    cache.bump_generation("catalog")
 
             else:
                 return Response({"error": "Refund processing failed."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -267,3 +270,78 @@ class ApiDeveloperSettings(mixins.UpdateModelMixin, viewsets.GenericViewSet):
     @swagger_helper("Admin", "Admin developer settings page")
     def partial_update(self, request, *args, **kwargs):
         return super().update(request, *args, **kwargs)
+
+
+class ApiCacheMetrics(viewsets.GenericViewSet):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(operation_id="Admin cache metrics", operation_description="cache backend health, hit/miss counters per key prefix and sampled latency histograms", tags=["Admin"])
+    def list(self, request, *args, **kwargs):
+        return Response({"data": {"backend": cache.health(), **cache.metrics.snapshot()}})
+
+    @swagger_auto_schema(operation_id="Reset admin cache metrics", operation_description="reset cache counters and latency histograms", tags=["Admin"])
+    def destroy(self, request, *args, **kwargs):
+        cache.metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ApiPaymentProviderMetrics(viewsets.GenericViewSet):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(operation_id="Admin payment provider metrics", operation_description="request and error counters and latency histograms of calls to each payment provider, for this process", tags=["Admin"])
+    def list(self, request, *args, **kwargs):
+        return Response({"data": provider_metrics.snapshot()})
+
+    @swagger_auto_schema(operation_id="Reset admin payment provider metrics", operation_description="reset payment provider counters and latency histograms", tags=["Admin"])
+    def destroy(self, request, *args, **kwargs):
+        provider_metrics.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ApiWebhookMetrics(viewsets.GenericViewSet):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(operation_id="Admin webhook metrics", operation_description="payment webhook inbox backlog depth, age of the oldest unprocessed event and processing lag over the last hour", tags=["Admin"])
+    def list(self, request, *args, **kwargs):
+        return Response({"data": WebhookEvent.objects.metrics()})
+
+
+class ApiCatalogImport(viewsets.GenericViewSet):
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file', openapi.IN_FORM, description="CSV or JSONL catalog file", type=openapi.TYPE_FILE, required=True),
+        openapi.Parameter('file_format', openapi.IN_FORM, description="csv or jsonl; taken from the file name when omitted", type=openapi.TYPE_STRING)],
+        operation_id="Admin catalog import", operation_description="bulk create or update products, sizes and categories; poll the returned job for progress", tags=["Admin"])
+    def create(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "Upload a CSV or JSONL file as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = (request.data.get("file_format") or upload.name.rsplit(".", 1)[-1]).lower()
+        if file_format not in FORMATS:
+            return Response({"error": f"file_format must be one of: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        job_id = start_catalog_import(upload, file_format)
+        return Response({"data": {"job_id": job_id, **import_status(job_id)}}, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(operation_id="Admin catalog import status", operation_description="progress and result of a catalog import", tags=["Admin"])
+    def retrieve(self, request, *args, **kwargs):
+        job_status = import_status(kwargs["pk"])
+        if job_status is None:
+            return Response({"error": "Import job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"data": {"job_id": kwargs["pk"], **job_status}})
+
+
+class ApiCatalogExport(viewsets.GenericViewSet):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(manual_parameters=[openapi.Parameter('file_format', openapi.IN_QUERY, description="csv (default) or jsonl", type=openapi.TYPE_STRING)],
+                         operation_id="Admin catalog export", operation_description="stream every product with its category names and sizes", tags=["Admin"])
+    def list(self, request, *args, **kwargs):
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in FORMATS:
+            return Response({"error": f"file_format must be one of: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(export_catalog(file_format), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="catalog.{file_format}"'
+        return response
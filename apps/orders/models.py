@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from ..products.models import Product
 import uuid
@@ -13,6 +13,33 @@ STATUS_CHOICES = (
 )
 
 
+class OrderManager(models.Manager):
+    def create_from_cart(self, cart_items, **fields):
+        """
+        Create an order and snapshot each cart item into an OrderItem with one bulk INSERT.
+
+        cart_items should come with product and size loaded (Cart.objects.with_checkout_items()). The inserts run
+        in a savepoint, so a duplicate tx_ref leaves the surrounding transaction usable.
+        """
+        with transaction.atomic():
+            order = self.create(**fields)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=item.product,
+                    quantity=item.quantity,
+                    name=item.product.name,
+                    description=item.product.description,
+                    colour=item.product.colour,
+                    image1=item.product.image1,
+                    price=item.size.price,
+                    size=item.size.size
+                )
+                for item in cart_items
+            ])
+        return order
+
+
 class Order(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="order_user")
@@ -34,6 +61,8 @@ class Order(models.Model):
     payment_provider = models.CharField(max_length=20, null=True, blank=True)
     estimated_delivery = models.CharField(max_length=100)
 
+    objects = OrderManager()
+
     def __str__(self):
         return f"Order - {self.id} - {self.user.email}"
 
@@ -7,6 +7,7 @@ from .tasks import (send_manual_refund_notification_email, send_refund_initiated
                     send_refund_email_synchronously, send_refund_initiated_email_synchronously,refund_confirmation_email)
 from django.utils.functional import SimpleLazyObject
 from ..ecommerce_admin.models import OrganizationSettings, DeveloperSettings
+from ..payment.providers import get_provider
 
 ADMIN_EMAIL = SimpleLazyObject(
     lambda: getattr(OrganizationSettings.objects.first(), 'admin_email', None ))
@@ -30,36 +31,14 @@ def swagger_helper(tags, model):
 
 
 def initiate_refund(order, is_admin=False):
+    if order.payment_provider not in settings.PAYMENT_PROVIDERS:
+        return False
     try:
-        if order.payment_provider == "paystack":
-            payload = {"transaction": order.transaction_id}
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['paystack']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            response = requests.post(
-                "https://api.paystack.co/refund",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            notify_admin_for_refund_initiated(order)
-            notify_user_for_refunded_order(order)
-            return True
-        elif order.payment_provider == "flutterwave":
-            if not order.transaction_id:
-                return False
-            url = f"https://api.flutterwave.com/v3/transactions/{order.transaction_id}/refund"
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['flutterwave']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            payload = {}
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            notify_admin_for_refund_initiated(order)
-            notify_user_for_refunded_order(order)
-            return True
+        if not get_provider(order.payment_provider).refund(order.transaction_id):
+            return False
+        notify_admin_for_refund_initiated(order)
+        notify_user_for_refunded_order(order)
+        return True
     except requests.exceptions.RequestException:
         notify_admin_for_manual_refund(order)
         return False
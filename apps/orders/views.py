@@ -18,6 +18,7 @@ class ApiOrder(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     ordering_fields = ['order_date', 'total_amount']
     ordering = ['-order_date', '-created_at']
+    keyset_ordering = ['-order_date', '-created_at', 'id']
     filterset_fields = ["status"]
 
     def get_serializer_class(self):
@@ -73,12 +74,8 @@ class ApiOrder(viewsets.ModelViewSet):
                         else:
                             return Response({"error": "Product size not found."}, status=status.HTTP_400_BAD_REQUEST)
 
-                    cache.delete_pattern("product_list:*")
-                    for product_id in product_ids:
-                        cache.delete_pattern(f"product_detail:{product_id}")
-                    cache.delete_pattern("product_suggestions:*")
-                    cache.delete_pattern("search:*")
-                    cache.delete_pattern("search_suggestions:*")
+                    cache.invalidate_tags([f"product:{product_id}" for product_id in product_ids])
+                    cache.bump_generation("catalog")
 
             else:
                 return Response({"error": "Refund processing failed. Admin has been notified."}, status=503)
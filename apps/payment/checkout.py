@@ -0,0 +1,154 @@
+from decimal import Decimal
+import requests
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.utils.timezone import now
+from ..cart.models import Cart
+from ..orders.models import Order
+from ..products.models import Product, ProductSize
+from .serializers import PaymentCartSerializer
+from .tasks import send_order_confirmation_email, is_celery_healthy, send_email_synchronously
+from .utils import initiate_refund, invalidate_checkout_caches
+from .variables import admin_email
+from .providers import get_provider
+
+# the lock spans provider verification and the write phase
+PAYMENT_LOCK_TIMEOUT = 60
+REFUND_REASONS = {True: "refund_initiated", "admin": "refund_admin_notified"}
+
+
+class PaymentError(Exception):
+    """A payment that did not become an order; views map `reason` to their response."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def verify_transaction(provider, tx_ref, transaction_id, amount):
+    """Confirm with the provider that the payment succeeded for at least `amount`, returning the provider's transaction id."""
+    try:
+        provider_transaction_id = get_provider(provider).verify(transaction_id, tx_ref, amount)
+    except requests.exceptions.RequestException:
+        raise PaymentError("provider_unavailable")
+    if provider_transaction_id is None:
+        raise PaymentError("verification_failed")
+    return provider_transaction_id
+
+
+def finalize_payment(tx_ref, provider, amount, transaction_id=None, **cart_lookup):
+    """
+    Turn a paid transaction into an order, once per tx_ref, for the cart matching `cart_lookup`.
+
+    The provider is asked before any transaction is opened; the cart and stock rows are locked only for the writes.
+    The redirect and the webhook can arrive together: a tx_ref-keyed cache lock lets one finalize while the other
+    gets "in_progress" straight away. Returns (order, created), or raises PaymentError, refunding the payment on a
+    stock shortage.
+    """
+    order = Order.objects.filter(tx_ref=tx_ref).first()
+    if order is not None:
+        return order, False
+    lock_key = f"payment_lock:{tx_ref}"
+    lock = cache.acquire_lock(lock_key, PAYMENT_LOCK_TIMEOUT)
+    if lock is None:
+        raise PaymentError("in_progress")
+    try:
+        order = Order.objects.filter(tx_ref=tx_ref).first()
+        if order is not None:
+            return order, False
+        cart = Cart.objects.filter(**cart_lookup).select_related("user").first()
+        if cart is None:
+            raise PaymentError("cart_not_found")
+        provider_transaction_id = verify_transaction(provider, tx_ref, transaction_id or tx_ref, amount)
+        try:
+            order, created = place_order(cart.id, cart.user, tx_ref, provider, amount, provider_transaction_id)
+        except PaymentError as e:
+            if e.reason != "insufficient_stock":
+                raise
+            refund_result = initiate_refund(provider=provider, amount=amount, user=cart.user, transaction_id=provider_transaction_id)
+            raise PaymentError(REFUND_REASONS.get(refund_result, "refund_failed"))
+        except IntegrityError:
+            order = Order.objects.filter(tx_ref=tx_ref).first()
+            if order is None:
+                raise
+            return order, False
+        if created:
+            send_confirmation(order, cart.user)
+        return order, created
+    finally:
+        # a lock that outlived PAYMENT_LOCK_TIMEOUT may belong to a later arrival by now
+        cache.release_lock(lock_key, lock)
+
+
+def place_order(cart_id, user, tx_ref, provider, amount, transaction_id):
+    """The write phase: check the total, deduct stock, create the order and empty the cart under the cart's row lock."""
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().with_checkout_items().get(id=cart_id)
+        # the cache lock is per process while Redis is down; the cart lock still serialises the database writes
+        order = Order.objects.filter(tx_ref=tx_ref).first()
+        if order is not None:
+            return order, False
+
+        server_total = PaymentCartSerializer(cart).data["total"]
+        if abs(Decimal(str(server_total)) - Decimal(str(amount))) > Decimal("0.01"):
+            raise PaymentError("amount_mismatch")
+
+        # Deduct stock for every item in one UPDATE; nothing is taken when any size falls short
+        cart_items = list(cart.cartitem_cart.all())
+        quantities = {}
+        for item in cart_items:
+            if not item.product.unlimited:
+                quantities[item.size_id] = quantities.get(item.size_id, 0) + item.quantity
+        if ProductSize.objects.deduct_stock(quantities):
+            raise PaymentError("insufficient_stock")
+
+        deducted_product_ids = {item.product_id for item in cart_items if item.size_id in quantities}
+        Product.objects.filter(id__in=deducted_product_ids).refresh_pricing()
+        sold_out = ProductSize.objects.filter(id__in=quantities, quantity=0).exists()
+
+        order = Order.objects.create_from_cart(
+            cart_items,
+            user=user,
+            status="PAID",
+            delivery_fee=cart.delivery_fee,
+            total_amount=server_total,
+            first_name=cart.first_name or user.first_name,
+            last_name=cart.last_name or user.last_name,
+            email=cart.email or user.email,
+            state=cart.state,
+            city=cart.city,
+            delivery_address=cart.delivery_address,
+            phone_number=cart.phone_number or user.phone_number,
+            transaction_id=transaction_id,
+            tx_ref=tx_ref,
+            payment_provider=provider,
+            estimated_delivery=cart.estimated_delivery
+        )
+        cart.cartitem_cart.all().delete()
+        # readers could re-cache pre-checkout stock if the cache were cleared before the commit
+        transaction.on_commit(lambda: invalidate_checkout_caches(user.id, deducted_product_ids, sold_out))
+    return order, True
+
+
+def send_confirmation(order, user):
+    if not is_celery_healthy():
+        send_email_synchronously(
+            order_id=str(order.id),
+            user=user,
+            total_amount=str(order.total_amount),
+            order_date=now().date(),
+            estimated_delivery=order.estimated_delivery,
+            admin_email=admin_email
+        )
+    else:
+        send_order_confirmation_email.apply_async(
+            kwargs={
+                'order_id': str(order.id),
+                'user_email': order.email,
+                'total_amount': str(order.total_amount),
+                'order_date': now().date(),
+                'estimated_delivery': order.estimated_delivery,
+                'admin_email': admin_email,
+                'user_id': user.id
+            }
+        )
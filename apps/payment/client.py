@@ -0,0 +1,120 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_HTTP_OPTIONS = {
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2,
+    "backoff_factor": 0.5,
+    "backoff_jitter": 0.25,
+    "pool_maxsize": 10,
+}
+# a 5xx or rate limit on a GET is retried; POSTs (charges, refunds) are retried only when the connection never opened
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+
+class ProviderMetrics:
+    """Request, HTTP error and transport error counters plus latency histograms per payment provider."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(lambda: defaultdict(int))
+            self.latencies = defaultdict(lambda: [0] * len(LATENCY_BUCKETS_MS))
+
+    def observe(self, provider, seconds, status_code=None, error=None):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self.lock:
+            counters = self.counters[provider]
+            counters['requests'] += 1
+            if error is not None:
+                counters[f'error_{error}'] += 1
+            elif status_code >= 400:
+                counters[f'http_{status_code // 100}xx'] += 1
+            self.latencies[provider][bucket] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counters = {provider: dict(values) for provider, values in self.counters.items()}
+            latencies = {provider: list(values) for provider, values in self.latencies.items()}
+        labels = [f"le_{bound}ms" if bound != float('inf') else "le_inf" for bound in LATENCY_BUCKETS_MS]
+        return {
+            provider: {**counters.get(provider, {}), 'latency_ms': dict(zip(labels, latencies.get(provider, [])))}
+            for provider in counters
+        }
+
+
+metrics = ProviderMetrics()
+
+
+class ProviderClient:
+    """
+    Calls to one payment provider over a pooled keep-alive session, with the provider's bearer key, default
+    timeouts and retries with jittered exponential backoff. Raises requests exceptions like requests.get/post.
+    """
+
+    def __init__(self, provider, options):
+        self.provider = provider
+        self.timeout = (options["connect_timeout"], options["read_timeout"])
+        retry = Retry(
+            total=options["retries"],
+            backoff_factor=options["backoff_factor"],
+            backoff_jitter=options["backoff_jitter"],
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=options["pool_maxsize"], max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, **kwargs):
+        secret_key = settings.PAYMENT_PROVIDERS[self.provider]["secret_key"]
+        kwargs["headers"] = {"Authorization": f"Bearer {secret_key}", "Content-Type": "application/json", **kwargs.get("headers", {})}
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            metrics.observe(self.provider, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        metrics.observe(self.provider, time.perf_counter() - start, status_code=response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def provider_client(provider):
+    """
+    The process's client for a provider, created on first use so forked workers do not share sockets.
+    Options come from settings.PAYMENT_HTTP, overridden per provider by PAYMENT_PROVIDERS[provider]["http"].
+    """
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                options = {**DEFAULT_HTTP_OPTIONS, **getattr(settings, "PAYMENT_HTTP", {}),
+                           **settings.PAYMENT_PROVIDERS[provider].get("http", {})}
+                client = _clients[provider] = ProviderClient(provider, options)
+    return client
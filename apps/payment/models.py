@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.db import models
+from django.db.models import Avg, F, Max, Min
+from django.utils import timezone
+from ..orders.models import Order
+
+WEBHOOK_STATUS_CHOICES = (
+    ('PENDING', 'Pending'),
+    ('PROCESSING', 'Processing'),
+    ('PROCESSED', 'Processed'),
+    ('FAILED', 'Failed'),
+)
+
+
+class WebhookEventQuerySet(models.QuerySet):
+    def claim(self, event_id):
+        """Move a pending event to PROCESSING; False when another worker got it first or it is already done."""
+        return self.filter(id=event_id, status="PENDING").update(
+            status="PROCESSING", attempts=F("attempts") + 1, started_at=timezone.now()) == 1
+
+    def stalled(self, pending_after, processing_after):
+        """
+        Pending events no worker picked up, and processing events whose worker died. An event waiting out a
+        retry backoff counts as stalled only once it is `pending_after` past its next attempt.
+        """
+        now = timezone.now()
+        return self.filter(
+            models.Q(status="PENDING", received_at__lt=now - pending_after) &
+            (models.Q(next_attempt_at__isnull=True) | models.Q(next_attempt_at__lt=now - pending_after)) |
+            models.Q(status="PROCESSING", started_at__lt=now - processing_after)
+        )
+
+    def metrics(self, window=timedelta(hours=1)):
+        now = timezone.now()
+        counts = dict(self.values_list("status").annotate(count=models.Count("id")).order_by())
+        oldest_pending = self.filter(status__in=["PENDING", "PROCESSING"]).aggregate(oldest=Min("received_at"))["oldest"]
+        lag = self.filter(processed_at__gte=now - window).aggregate(
+            average=Avg(F("processed_at") - F("received_at")), maximum=Max(F("processed_at") - F("received_at")))
+        return {
+            "backlog": counts.get("PENDING", 0) + counts.get("PROCESSING", 0),
+            "status_counts": {status: counts.get(status, 0) for status, _ in WEBHOOK_STATUS_CHOICES},
+            "oldest_pending_seconds": (now - oldest_pending).total_seconds() if oldest_pending else 0,
+            "processing_lag_seconds": {
+                "window_seconds": window.total_seconds(),
+                "average": lag["average"].total_seconds() if lag["average"] is not None else None,
+                "max": lag["maximum"].total_seconds() if lag["maximum"] is not None else None,
+            },
+        }
+
+
+class WebhookEvent(models.Model):
+    provider = models.CharField(max_length=20)
+    event = models.CharField(max_length=50)
+    # provider retries redeliver the same reference; the unique index turns them into no-ops
+    tx_ref = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=WEBHOOK_STATUS_CHOICES, default='PENDING', db_index=True)
+    result = models.CharField(max_length=50, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="webhook_events")
+    received_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # when the retry scheduled after a failed attempt is due
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = WebhookEventQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.provider} webhook - {self.tx_ref} - {self.status}"
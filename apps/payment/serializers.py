@@ -1,11 +1,12 @@
 from rest_framework import serializers
 from ..cart.models import Cart, CartItem
+from .providers import provider_choices
 
 
 class PaymentCartSerializer(serializers.ModelSerializer):
     subtotal = serializers.SerializerMethodField()
     total = serializers.SerializerMethodField()
-    provider = serializers.ChoiceField(choices=[("flutterwave", "Flutterwave"), ("paystack", "Paystack")], default="flutterwave", write_only=True)
+    provider = serializers.ChoiceField(choices=provider_choices(), default="flutterwave", write_only=True)
 
     class Meta:
         model = Cart
@@ -21,4 +22,4 @@ class PaymentCartSerializer(serializers.ModelSerializer):
 
 
 class InitiateSerializer(serializers.Serializer):
-    provider = serializers.ChoiceField(choices=[("flutterwave", "Flutterwave"), ("paystack", "Paystack")], default="flutterwave", write_only=True)
+    provider = serializers.ChoiceField(choices=provider_choices(), default="flutterwave", write_only=True)
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from .emails import order_confirmation_email, manual_refund_notification_email, user_refund_notification_email, admin_order_confirmation_email, admin_refund_notification_email
 from celery import shared_task, current_app
 from celery.exceptions import MaxRetriesExceededError
@@ -149,3 +150,21 @@ def send_user_refund_notification_email(self, user_id, amount, provider, transac
             self.retry(exc=e, countdown=30)
         except MaxRetriesExceededError:
             return send_user_refund_email_synchronously(user, amount, provider, transaction_id, currency, admin_email)
+
+
+# the attempt budget lives on the event (webhooks.MAX_ATTEMPTS), not in the task's retry count
+@shared_task(bind=True, max_retries=None)
+def process_webhook_event_task(self, event_id):
+    from .webhooks import process_webhook_event, WebhookRetry
+    try:
+        result = process_webhook_event(event_id)
+    except WebhookRetry as e:
+        raise self.retry(exc=e, countdown=e.countdown)
+    return {"status": "success", "event_id": event_id, "result": result}
+
+
+@shared_task
+def requeue_stalled_webhooks_task():
+    from .webhooks import requeue_stalled_webhooks
+    requeued = requeue_stalled_webhooks(pending_after=timedelta(minutes=5), processing_after=timedelta(minutes=15))
+    return {"status": "success", "requeued": requeued}
@@ -0,0 +1,148 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..cart.models import Cart, CartItem
+from ..orders.models import Order
+from ..products.models import Product, ProductSize
+from .models import WebhookEvent
+from .providers import FakeProvider, get_provider
+from .checkout import PaymentError, finalize_payment, place_order
+from .webhooks import MAX_ATTEMPTS, WebhookRetry, process_webhook_event, requeue_stalled_webhooks
+
+FAKE_PROVIDERS = {**settings.PAYMENT_PROVIDERS, "fake": {"secret_key": "test-secret", "latency": 0}}
+
+
+def create_cart(user, item_count=1):
+    """A cart ready for checkout with one unit of `item_count` products at 100.00 each."""
+    cart = Cart.objects.create(
+        user=user, first_name="Ada", last_name="Obi", email=user.email, state="Lagos", city="Ikeja",
+        delivery_address="1 Allen Avenue", phone_number="08000000000", estimated_delivery="3 days",
+        delivery_fee=Decimal("0.00"))
+    for i in range(item_count):
+        product = Product.objects.create(name=f"Shirt {user.pk}-{i}", description="A shirt", colour="Blue", image1="product_images/shirt.jpg")
+        size = ProductSize.objects.create(product=product, size="M", quantity=5, price=Decimal("100.00"))
+        CartItem.objects.create(cart=cart, product=product, size=size, quantity=1)
+    return cart
+
+
+@override_settings(PAYMENT_PROVIDERS=FAKE_PROVIDERS)
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="buyer@example.com", password="password")
+        create_cart(self.user)
+        self.fake = get_provider("fake")
+        self.fake.initiate("tx-1", Decimal("100.00"), self.user, "https://example.com/verify")
+
+        # webhooks go to the (mocked) queue; confirmation emails are sent in-process
+        self.patch("apps.payment.webhooks.is_celery_healthy", return_value=True)
+        self.patch("apps.payment.checkout.is_celery_healthy", return_value=False)
+        self.apply_async = self.patch("apps.payment.webhooks.process_webhook_event_task.apply_async")
+
+    def patch(self, target, **kwargs):
+        patcher = mock.patch(target, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def post_webhook(self, reference="tx-1", amount="100.00"):
+        body, headers = self.fake.webhook(reference, amount, self.user.email)
+        return self.client.post(reverse("payment:payment-webhook"), body, content_type="application/json", **headers)
+
+    def test_webhook_is_acknowledged_before_processing(self):
+        with mock.patch.object(FakeProvider, "verify") as verify:
+            response = self.post_webhook()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"message": "Webhook received"})
+        event = WebhookEvent.objects.get(tx_ref="tx-1")
+        self.assertEqual(event.status, "PENDING")
+        self.apply_async.assert_called_once_with(kwargs={"event_id": event.id})
+        verify.assert_not_called()
+        self.assertFalse(Order.objects.filter(tx_ref="tx-1").exists())
+
+    def test_redelivered_webhook_is_deduplicated(self):
+        self.post_webhook()
+        event = WebhookEvent.objects.get(tx_ref="tx-1")
+        self.assertEqual(process_webhook_event(event.id), "processed")
+
+        response = self.post_webhook()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"message": "Webhook already received"})
+        self.assertEqual(WebhookEvent.objects.filter(tx_ref="tx-1").count(), 1)
+        self.assertEqual(self.apply_async.call_count, 1)
+        self.assertIsNone(process_webhook_event(event.id))
+        self.assertEqual(Order.objects.filter(tx_ref="tx-1").count(), 1)
+
+    def test_retryable_failure_returns_event_to_pending(self):
+        self.post_webhook()
+        event = WebhookEvent.objects.get(tx_ref="tx-1")
+        with mock.patch.object(FakeProvider, "verify", side_effect=requests.exceptions.ConnectionError):
+            with self.assertRaises(WebhookRetry):
+                process_webhook_event(event.id)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.result, event.attempts), ("PENDING", "provider_unavailable", 1))
+        self.assertIsNotNone(event.next_attempt_at)
+        self.assertFalse(Order.objects.filter(tx_ref="tx-1").exists())
+
+        # the sweep leaves an event alone while its retry is still due
+        WebhookEvent.objects.filter(id=event.id).update(received_at=event.received_at - timedelta(hours=1))
+        self.assertEqual(requeue_stalled_webhooks(pending_after=timedelta(minutes=5), processing_after=timedelta(minutes=15)), 0)
+
+        self.assertEqual(process_webhook_event(event.id), "processed")
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("PROCESSED", 2))
+        self.assertEqual(event.order, Order.objects.get(tx_ref="tx-1"))
+
+    def test_final_attempt_records_failure(self):
+        self.post_webhook()
+        event = WebhookEvent.objects.get(tx_ref="tx-1")
+        WebhookEvent.objects.filter(id=event.id).update(attempts=MAX_ATTEMPTS - 1)
+        with mock.patch.object(FakeProvider, "verify", side_effect=requests.exceptions.ConnectionError):
+            self.assertEqual(process_webhook_event(event.id), "provider_unavailable")
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("FAILED", MAX_ATTEMPTS))
+        self.assertIsNotNone(event.processed_at)
+        self.assertFalse(Order.objects.filter(tx_ref="tx-1").exists())
+
+    def test_inline_retry_still_acknowledges_webhook(self):
+        with mock.patch("apps.payment.webhooks.is_celery_healthy", return_value=False), \
+                mock.patch.object(FakeProvider, "verify", side_effect=requests.exceptions.ConnectionError), \
+                self.assertLogs("apps.payment.webhooks", "WARNING"):
+            response = self.post_webhook()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"message": "Webhook received"})
+        event = WebhookEvent.objects.get(tx_ref="tx-1")
+        self.assertEqual((event.status, event.result, event.attempts), ("PENDING", "provider_unavailable", 1))
+        self.apply_async.assert_not_called()
+
+    def test_concurrent_finalize_answers_in_progress(self):
+        lock = cache.acquire_lock("payment_lock:tx-1", 60)
+        self.addCleanup(cache.release_lock, "payment_lock:tx-1", lock)
+        with mock.patch("apps.payment.checkout.verify_transaction") as verify:
+            with self.assertRaises(PaymentError) as raised:
+                finalize_payment("tx-1", "fake", Decimal("100.00"), user=self.user)
+        self.assertEqual(raised.exception.reason, "in_progress")
+        verify.assert_not_called()
+
+
+class PlaceOrderQueryCountTests(TestCase):
+    def test_query_count_does_not_grow_with_cart_size(self):
+        User = get_user_model()
+        small = create_cart(User.objects.create_user(email="small@example.com", password="password"), 1)
+        large = create_cart(User.objects.create_user(email="large@example.com", password="password"), 50)
+
+        with CaptureQueriesContext(connection) as baseline:
+            place_order(small.id, small.user, "tx-small", "paystack", Decimal("100.00"), "tx-small")
+        with self.assertNumQueries(len(baseline)):
+            order, created = place_order(large.id, large.user, "tx-large", "paystack", Decimal("5000.00"), "tx-large")
+
+        self.assertTrue(created)
+        self.assertEqual(order.orderitem_order.count(), 50)
+        self.assertFalse(large.cartitem_cart.exists())
+        self.assertEqual(set(ProductSize.objects.filter(product__name__startswith=f"Shirt {large.user.pk}-").values_list("quantity", flat=True)), {4})
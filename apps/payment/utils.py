@@ -3,11 +3,12 @@ from math import radians, sin, cos, sqrt, atan2
 from datetime import timedelta
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils.timezone import now
-import requests
 from django.conf import settings
+from django.core.cache import cache
 from .tasks import is_celery_healthy, send_refund_email_synchronously, send_manual_refund_notification_email, \
     send_user_refund_email_synchronously, send_user_refund_notification_email
 from .variables import warehouse_city, available_states, admin_email
+from .providers import get_provider
 
 AVAILABLE_STATES = available_states
 WAREHOUSE_CITY = warehouse_city
@@ -68,6 +69,12 @@ def calculate_distance(coord1, coord2):
     return R * c
 
 
+def invalidate_checkout_caches(user_id, product_ids, sold_out):
+    cache.invalidate_tags([f"cart:{user_id}", *(f"product:{product_id}" for product_id in product_ids)])
+    if sold_out:
+        cache.bump_generation("catalog")
+
+
 def generate_confirm_token(user, cart_id):
     try:
         refresh = RefreshToken.for_user(user)
@@ -97,33 +104,10 @@ def swagger_helper(tags, model):
 
 def initiate_refund(provider, amount, user, transaction_id):
     try:
-        if provider == "paystack":
-            payload = {"transaction": transaction_id}
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['paystack']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            response = requests.post(
-                "https://api.paystack.co/refund",
-                json=payload,
-                headers=headers
-            )
-            response.raise_for_status()
-            notify_user_for_successful_refund(provider, amount, user, transaction_id)
-            return True
-        elif provider == "flutterwave":
-            if not transaction_id:
-                return False
-            url = f"https://api.flutterwave.com/v3/transactions/{transaction_id}/refund"
-            headers = {
-                "Authorization": f"Bearer {settings.PAYMENT_PROVIDERS['flutterwave']['secret_key']}",
-                "Content-Type": "application/json"
-            }
-            payload = {}
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            notify_user_for_successful_refund(provider, amount, user, transaction_id)
-            return True
+        if not get_provider(provider).refund(transaction_id):
+            return False
+        notify_user_for_successful_refund(provider, amount, user, transaction_id)
+        return True
     except:
         try:
             notify_admin_for_manual_refund(provider, amount, user, transaction_id)
@@ -0,0 +1,113 @@
+import logging
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .checkout import finalize_payment, PaymentError
+from .models import WebhookEvent
+from .providers import get_provider
+from .tasks import is_celery_healthy, process_webhook_event_task
+
+logger = logging.getLogger(__name__)
+
+# the provider could not be reached, or the redirect is finalizing the same tx_ref: worth another attempt
+RETRYABLE_REASONS = {"provider_unavailable", "in_progress"}
+# handled outcomes; anything else leaves the event FAILED for a person to look at
+PROCESSED_RESULTS = {"processed", "already_processed", "refund_initiated", "refund_admin_notified"}
+# counted on the event, so retries from provider redeliveries, the sweep and Celery all share the budget
+MAX_ATTEMPTS = 6
+RETRY_BACKOFF = 30
+
+
+class WebhookRetry(Exception):
+    """An attempt failed and the event is back to PENDING; the next one is due in `countdown` seconds."""
+
+    def __init__(self, result, countdown):
+        super().__init__(result)
+        self.result = result
+        self.countdown = countdown
+
+
+def enqueue_webhook(provider, payload, charge):
+    """
+    Store a verified webhook and hand it to a worker. Returns False for a redelivery of a stored event, which is
+    dispatched again only while still pending, so provider retries double as retries of our own processing.
+    """
+    try:
+        # a savepoint, so the duplicate's IntegrityError leaves any surrounding transaction usable
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(provider=provider, event=payload.get("event", ""), tx_ref=charge["tx_ref"], payload=payload)
+    except IntegrityError:
+        event = WebhookEvent.objects.filter(tx_ref=charge["tx_ref"], status="PENDING").only("id").first()
+        if event is not None:
+            dispatch_webhook_event(event.id)
+        return False
+    dispatch_webhook_event(event.id)
+    return True
+
+
+def dispatch_webhook_event(event_id):
+    if not is_celery_healthy():
+        # processed inline, but the webhook is already acknowledged: a failure stays on the event, not the response
+        try:
+            process_webhook_event(event_id)
+        except WebhookRetry as e:
+            logger.warning("Webhook event %s will be retried by the sweep or a redelivery: %s", event_id, e.result)
+        except Exception:
+            logger.exception("Webhook event %s failed on its final attempt", event_id)
+    else:
+        process_webhook_event_task.apply_async(
+            kwargs={
+                'event_id': event_id
+            }
+        )
+
+
+def process_webhook_event(event_id):
+    """
+    Finalize the payment a stored webhook reports, at most once per event.
+
+    Returns the result recorded on the event, or None when another worker claimed it. Retryable failures and
+    errors put the event back to PENDING and raise WebhookRetry, until its MAX_ATTEMPTS-th attempt, which
+    records them as FAILED.
+    """
+    if not WebhookEvent.objects.claim(event_id):
+        return None
+    event = WebhookEvent.objects.get(id=event_id)
+    final_attempt = event.attempts >= MAX_ATTEMPTS
+    charge = get_provider(event.provider).parse_webhook(event.payload)
+    order = None
+    try:
+        if (user := get_user_model().objects.filter(email=charge["email"]).first()) is None:
+            result = "user_not_found"
+        else:
+            order, created = finalize_payment(event.tx_ref, event.provider, charge["amount"], charge["transaction_id"], user=user)
+            result = "processed" if created else "already_processed"
+    except PaymentError as e:
+        if e.reason in RETRYABLE_REASONS and not final_attempt:
+            raise retry_later(event, e.reason) from e
+        result = e.reason
+    except Exception as e:
+        if not final_attempt:
+            raise retry_later(event, "error") from e
+        WebhookEvent.objects.filter(id=event_id).update(status="FAILED", result="error", processed_at=timezone.now())
+        raise
+    status = "PROCESSED" if result in PROCESSED_RESULTS else "FAILED"
+    WebhookEvent.objects.filter(id=event_id).update(status=status, result=result, order=order, processed_at=timezone.now())
+    return result
+
+
+def retry_later(event, result):
+    countdown = RETRY_BACKOFF * 2 ** (event.attempts - 1)
+    WebhookEvent.objects.filter(id=event.id).update(
+        status="PENDING", result=result, next_attempt_at=timezone.now() + timedelta(seconds=countdown))
+    return WebhookRetry(result, countdown)
+
+
+def requeue_stalled_webhooks(pending_after, processing_after):
+    """Dispatch events whose task was lost (broker down, worker killed) again."""
+    stalled = list(WebhookEvent.objects.stalled(pending_after, processing_after).values_list("id", flat=True))
+    WebhookEvent.objects.filter(id__in=stalled, status="PROCESSING").update(status="PENDING")
+    for event_id in stalled:
+        dispatch_webhook_event(event_id)
+    return len(stalled)
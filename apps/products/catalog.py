@@ -0,0 +1,271 @@
+import csv
+import io
+import json
+from itertools import islice
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
+from .models import Product, ProductCategory, ProductSubCategory, ProductSize
+
+FORMATS = ("csv", "jsonl")
+PRODUCT_FIELDS = ["name", "description", "colour", "image1", "image2", "image3", "weight", "dimensional_size", "is_available", "latest_item",
+                  "latest_item_position", "top_selling_items", "top_selling_position", "unlimited", "production_days"]
+SIZE_FIELDS = ["size", "quantity", "price", "undiscounted_price"]
+# one row per size in CSV; a product without sizes is a single row with the size columns empty
+CSV_COLUMNS = ["category", "sub_category", *PRODUCT_FIELDS, *SIZE_FIELDS]
+REQUIRED_FOR_NEW = ["description", "colour", "image1"]
+MAX_REPORTED_ERRORS = 100
+IMPORT_STATUS_TIMEOUT = 24 * 60 * 60
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def read_rows(stream, file_format):
+    """(line number, raw row) pairs, read lazily from a text stream."""
+    if file_format == "csv":
+        return enumerate(csv.DictReader(stream), start=2)
+    return ((line_no, line) for line_no, line in enumerate(stream, start=1) if line.strip())
+
+
+def parse_row(row, file_format):
+    """A product record from a raw row: product fields, category names and a list of sizes. Blank CSV cells are left out."""
+    if file_format == "jsonl":
+        record = json.loads(row)
+        if not isinstance(record, dict):
+            raise ValidationError("Expected a JSON object")
+        return record
+    record = {name: value for name, value in row.items() if name and value not in ("", None)}
+    size = {name: record.pop(name) for name in SIZE_FIELDS if name in record}
+    record["sizes"] = [size] if size else []
+    return record
+
+
+def clean_value(field, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if isinstance(field, models.BooleanField):
+            value = value.lower() in ("1", "true", "t", "yes", "y")
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise ValidationError(f"{field.name}: {'; '.join(e.messages)}")
+
+
+def clean_fields(model, names, record):
+    return {name: clean_value(model._meta.get_field(name), record[name]) for name in names if name in record}
+
+
+def clean_record(record):
+    if not str(record.get("name") or "").strip():
+        raise ValidationError("name is required")
+    sizes = {}
+    for size in record.get("sizes") or []:
+        if not str(size.get("size") or "").strip():
+            raise ValidationError("size is required for every size entry")
+        cleaned = clean_fields(ProductSize, SIZE_FIELDS, size)
+        sizes[cleaned.pop("size")] = cleaned
+    return {
+        "fields": clean_fields(Product, PRODUCT_FIELDS, record),
+        "category": str(record.get("category") or "").strip() or None,
+        "sub_category": str(record.get("sub_category") or "").strip() or None,
+        "sizes": sizes,
+    }
+
+
+def apply_changes(instance, values):
+    """Set the values that differ from the instance's and return their field names, so unchanged rows are not rewritten."""
+    changed = [field for field, value in values.items() if getattr(instance, field) != value]
+    for field in changed:
+        setattr(instance, field, values[field])
+    return changed
+
+
+class CatalogImporter:
+    """
+    Upserts products (matched on name) and their sizes in batches of bulk_create/bulk_update.
+
+    Rows that match what is stored are skipped. Pricing and search documents of changed products are refreshed once
+    per batch, and the cache is invalidated once at the end.
+    """
+
+    def __init__(self, batch_size=1000, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.subcategories = {}
+        self.categories = {}
+        self.touched_ids = set()
+        self.stats = {"rows": 0, "products_created": 0, "products_updated": 0, "sizes_created": 0, "sizes_updated": 0, "errors": 0}
+        self.errors = []
+
+    def run(self, stream, file_format):
+        rows = read_rows(stream, file_format)
+        while batch := list(islice(rows, self.batch_size)):
+            records = []
+            for line_no, row in batch:
+                try:
+                    records.append((line_no, clean_record(parse_row(row, file_format))))
+                except (ValidationError, ValueError) as e:
+                    self.error(line_no, e)
+            self.import_batch(records)
+            self.stats["rows"] += len(batch)
+            if self.progress:
+                self.progress(self.report())
+        self.invalidate()
+        return self.report()
+
+    def report(self):
+        return {**self.stats, "error_details": self.errors}
+
+    def error(self, line_no, error):
+        self.stats["errors"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            message = "; ".join(error.messages) if isinstance(error, ValidationError) else str(error)
+            self.errors.append({"line": line_no, "error": message})
+
+    def import_batch(self, records):
+        # rows for the same product, within a batch, are merged; later rows win
+        merged = {}
+        for line_no, record in records:
+            name = record["fields"]["name"]
+            item = merged.setdefault(name, {"line": line_no, "fields": {}, "category": None, "sub_category": None, "sizes": {}})
+            item["fields"].update(record["fields"])
+            item["category"] = record["category"] or item["category"]
+            item["sub_category"] = record["sub_category"] or item["sub_category"]
+            for size, values in record["sizes"].items():
+                item["sizes"].setdefault(size, {}).update(values)
+        if not merged:
+            return
+
+        with transaction.atomic():
+            existing = Product.objects.in_bulk(list(merged), field_name="name")
+            to_create, to_update, update_fields = [], [], set()
+            for name, item in list(merged.items()):
+                product = existing.get(name)
+                missing = [field for field in REQUIRED_FOR_NEW if field not in item["fields"]]
+                if product is None and missing:
+                    self.error(item["line"], ValidationError(f"new product needs {', '.join(missing)}"))
+                    del merged[name]
+                    continue
+                fields = dict(item["fields"])
+                if item["sub_category"]:
+                    try:
+                        fields["sub_category_id"] = self.subcategory_id(item["sub_category"], item["category"])
+                    except ValidationError as e:
+                        self.error(item["line"], e)
+                        del merged[name]
+                        continue
+                if product is None:
+                    to_create.append(Product(**fields))
+                elif changed := apply_changes(product, fields):
+                    product.date_updated = timezone.now().date()
+                    update_fields.update(changed, ["date_updated"])
+                    to_update.append(product)
+            Product.objects.bulk_create(to_create, batch_size=self.batch_size)
+            if to_update:
+                Product.objects.bulk_update(to_update, update_fields, batch_size=self.batch_size)
+            # bulk_create does not return primary keys on every backend
+            products = Product.objects.filter(name__in=list(merged)).in_bulk(field_name="name")
+            changed_ids = self.import_sizes({products[name].id: item["sizes"] for name, item in merged.items()})
+            changed_ids.update(products[product.name].id for product in to_create + to_update)
+            if changed_ids:
+                changed = Product.objects.filter(id__in=changed_ids)
+                changed.refresh_pricing()
+                changed.refresh_search_document(self.batch_size)
+        self.stats["products_created"] += len(to_create)
+        self.stats["products_updated"] += len(to_update)
+        self.touched_ids.update(changed_ids)
+
+    def import_sizes(self, sizes_by_product):
+        """Create or update sizes, returning the ids of products whose sizes changed."""
+        existing = {(size.product_id, size.size): size for size in ProductSize.objects.filter(product_id__in=sizes_by_product)}
+        to_create, to_update, update_fields = [], [], set()
+        for product_id, sizes in sizes_by_product.items():
+            for name, values in sizes.items():
+                size = existing.get((product_id, name))
+                if size is None:
+                    to_create.append(ProductSize(product_id=product_id, size=name, **values))
+                elif changed := apply_changes(size, values):
+                    update_fields.update(changed)
+                    to_update.append(size)
+        ProductSize.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if to_update:
+            ProductSize.objects.bulk_update(to_update, update_fields, batch_size=self.batch_size)
+        self.stats["sizes_created"] += len(to_create)
+        self.stats["sizes_updated"] += len(to_update)
+        return {size.product_id for size in to_create + to_update}
+
+    def subcategory_id(self, name, category_name):
+        if name not in self.subcategories:
+            subcategory = ProductSubCategory.objects.filter(name=name).only("id").first()
+            if subcategory is None:
+                if not category_name:
+                    raise ValidationError(f"sub_category '{name}' does not exist and no category was given to create it under")
+                if category_name not in self.categories:
+                    self.categories[category_name] = ProductCategory.objects.get_or_create(name=category_name)[0].id
+                subcategory = ProductSubCategory.objects.create(name=name, category_id=self.categories[category_name])
+            self.subcategories[name] = subcategory.id
+        return self.subcategories[name]
+
+    def invalidate(self):
+        if not self.touched_ids:
+            return
+        cache.invalidate_tags(["categories", "subcategories", "carts", "wishlists", *(f"product:{pk}" for pk in self.touched_ids)])
+        cache.bump_generation("catalog")
+
+
+def import_status(job_id):
+    return cache.get(f"catalog_import:{job_id}")
+
+
+def set_import_status(job_id, status, **details):
+    cache.set(f"catalog_import:{job_id}", {"status": status, **details}, IMPORT_STATUS_TIMEOUT)
+
+
+def run_stored_import(path, file_format, job_id, batch_size=1000):
+    """Import an uploaded file from default storage, publishing progress under the job id, then delete the file."""
+    set_import_status(job_id, "running")
+    try:
+        with default_storage.open(path, "rb") as raw:
+            stream = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+            report = CatalogImporter(batch_size, lambda report: set_import_status(job_id, "running", **report)).run(stream, file_format)
+    except Exception as e:
+        set_import_status(job_id, "failed", error=str(e))
+        raise
+    finally:
+        default_storage.delete(path)
+    set_import_status(job_id, "completed", **report)
+    return report
+
+
+def product_record(product):
+    record = {
+        "category": product.sub_category.category.name if product.sub_category else None,
+        "sub_category": product.sub_category.name if product.sub_category else None,
+    }
+    for name in PRODUCT_FIELDS:
+        value = getattr(product, name)
+        record[name] = (value.name or None) if isinstance(value, models.fields.files.FieldFile) else value
+    record["sizes"] = [{name: getattr(size, name) for name in SIZE_FIELDS} for size in product.sizes.all()]
+    return record
+
+
+def export_catalog(file_format, batch_size=1000):
+    """The catalog as CSV or JSONL text, yielded a row at a time from chunked queries."""
+    products = Product.objects.select_related("sub_category__category").prefetch_related("sizes").order_by("id")
+    writer = csv.writer(Echo())
+    if file_format == "csv":
+        yield writer.writerow(CSV_COLUMNS)
+    for product in products.iterator(chunk_size=batch_size):
+        record = product_record(product)
+        if file_format == "jsonl":
+            yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+            continue
+        for size in record.pop("sizes") or [{}]:
+            values = {**record, **size}
+            yield writer.writerow(["" if values.get(column) is None else values[column] for column in CSV_COLUMNS])
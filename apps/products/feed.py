@@ -0,0 +1,34 @@
+import random
+from django.conf import settings
+from django.core.cache import cache
+from .models import Product
+
+HOMEPAGE_FEED_SIZE = 20
+
+
+def _fill(prioritized, pool):
+    needed = HOMEPAGE_FEED_SIZE - len(prioritized)
+    if needed <= 0:
+        return prioritized
+    chosen = set(prioritized)
+    sample = random.sample(pool, min(len(pool), needed + len(chosen)))
+    return prioritized + [product_id for product_id in sample if product_id not in chosen][:needed]
+
+
+def build_homepage_feed():
+    """Materialize the homepage id lists: admin-positioned products first, topped up with random picks from the catalog."""
+    latest = list(Product.objects.filter(latest_item=True, latest_item_position__isnull=False).order_by("latest_item_position").values_list("id", flat=True))
+    top_selling = list(Product.objects.filter(top_selling_items=True, top_selling_position__isnull=False).order_by("top_selling_position").values_list("id", flat=True))
+    pool = list(Product.objects.values_list("id", flat=True))
+    return {"latest_items": _fill(latest, pool), "top_selling_items": _fill(top_selling, pool)}
+
+
+def refresh_homepage_feed():
+    feed = build_homepage_feed()
+    cache.set_fresh("homepage_feed", feed, int(settings.CACHE_TIMEOUT), generation=cache.get_generation("catalog"))
+    return feed
+
+
+def get_homepage_feed():
+    # a catalog write moves the generation: one request rebuilds the feed while the rest keep serving the previous one
+    return cache.get_or_compute("homepage_feed", build_homepage_feed, int(settings.CACHE_TIMEOUT), generation=cache.get_generation("catalog"))
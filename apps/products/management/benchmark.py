@@ -0,0 +1,64 @@
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from ..models import Product, ProductSize
+
+
+@contextmanager
+def benchmark_environment():
+    """
+    Run a benchmark the way the test runner runs tests: against a throwaway test database, so the rows it seeds
+    never reach the configured one, with outgoing email kept in memory and the test client's host allowed.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_products(count, batch_size=5000):
+    """`count` products with one priced, stocked size each; returns their ids."""
+    Product.objects.bulk_create([
+        Product(name=f"Benchmark product {i}", description=f"Benchmark product number {i}", colour="Black",
+                image1="product_images/benchmark.jpg")
+        for i in range(count)
+    ], batch_size=batch_size)
+    # MySQL does not return the ids of bulk-created rows
+    product_ids = list(Product.objects.filter(name__startswith="Benchmark product ").values_list("id", flat=True))
+    ProductSize.objects.bulk_create(
+        [ProductSize(product_id=product_id, size="M", quantity=10, price=Decimal("100.00")) for product_id in product_ids],
+        batch_size=batch_size)
+    Product.objects.refresh_pricing()
+    return product_ids
+
+
+def timed(function, repeat=1, setup=None):
+    """Median wall time of `repeat` calls, in milliseconds; `setup` runs untimed before each one."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+@contextmanager
+def count_queries():
+    """The SQL run inside the block; unlike CaptureQueriesContext it survives the reset each test-client request does."""
+    statements = []
+
+    def record(execute, sql, params, many, context):
+        statements.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        yield statements
@@ -0,0 +1,72 @@
+import statistics
+import threading
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+KEY = "bench_stampede"
+NAMESPACE = "bench_stampede"
+
+
+class Command(BaseCommand):
+    help = ("Reproduce a cache stampede: --clients concurrent requests read one expensive entry, through a plain "
+            "get/compute/set and through get_or_compute, first with nothing cached and then with a stale entry left by "
+            "a generation bump. Uses the configured cache, so point it at a development Redis.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=30, help="Concurrent requests")
+        parser.add_argument("--cost", type=int, default=300, help="Milliseconds each rebuild takes")
+
+    def handle(self, *args, **options):
+        rebuilds = []
+
+        def compute():
+            # stands in for the expensive query behind a catalog response
+            rebuilds.append(1)
+            time.sleep(options["cost"] / 1000)
+            return "response"
+
+        def read_through():
+            value = cache.get(KEY)
+            if value is None:
+                value = compute()
+                cache.set(KEY, value, 60)
+            return value
+
+        def coalesced():
+            return cache.get_or_compute(KEY, compute, 60, generation=cache.get_generation(NAMESPACE))
+
+        def leave_stale():
+            cache.set_fresh(KEY, "response", 60, generation=cache.get_generation(NAMESPACE))
+            cache.bump_generation(NAMESPACE)
+
+        scenarios = [
+            ("get/compute/set, nothing cached", read_through, lambda: cache.delete(KEY)),
+            ("get_or_compute, nothing cached", coalesced, lambda: cache.delete(KEY)),
+            ("get_or_compute, stale entry", coalesced, leave_stale),
+        ]
+        try:
+            for name, read, setup in scenarios:
+                setup()
+                rebuilds.clear()
+                latencies = []
+                barrier = threading.Barrier(options["clients"])
+
+                def client():
+                    # each thread gets its own cache connection; open it before the clock starts
+                    cache.get_generation(NAMESPACE)
+                    barrier.wait()
+                    start = time.perf_counter()
+                    read()
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+                threads = [threading.Thread(target=client) for _ in range(options["clients"])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.stdout.write(f"{name}: {len(rebuilds)} rebuilds, median {statistics.median(latencies):.0f}ms, "
+                                  f"slowest {max(latencies):.0f}ms")
+        finally:
+            cache.delete(KEY)
+            cache.delete(f"generation:{NAMESPACE}")
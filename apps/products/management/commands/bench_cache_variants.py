@@ -0,0 +1,62 @@
+import random
+from urllib.parse import urlencode
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from ..benchmark import benchmark_environment, seed_products
+
+# what the product-list requests really ask for; everything else in their query strings is noise
+PAGES = (1, 2, 3, 4, 5)
+PAGE_SIZES = (10, 20)
+
+
+def noisy_query(rng):
+    params = [("page", rng.choice(PAGES)), ("page_size", rng.choice(PAGE_SIZES))]
+    if rng.random() < 0.5:
+        params.append(("utm_source", f"campaign{rng.randrange(50)}"))
+    if rng.random() < 0.3:
+        params.append(("_", rng.randrange(10 ** 9)))
+    if rng.random() < 0.2:
+        # DRF reads the last value of a repeated param
+        params.insert(0, ("page_size", rng.choice(PAGE_SIZES)))
+    rng.shuffle(params)
+    return urlencode(params)
+
+
+class Command(BaseCommand):
+    help = ("Measure response-cache hit ratios for per-user cart reads and for product-list requests whose query strings "
+            "carry tracking params, cache busters, repeats and shuffled order. Seeds a throwaway test database and uses "
+            "the configured cache, so point it at a development Redis.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1500, help="Users that each read their cart twice")
+        parser.add_argument("--requests", type=int, default=2000, help="Anonymous product-list requests")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the product-list query strings")
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            seed_products(200)
+            User = get_user_model()
+            User.objects.bulk_create([User(email=f"benchmark{i}@example.com", password="!") for i in range(options["users"])])
+            users = list(User.objects.filter(email__startswith="benchmark"))
+            for pattern in ("cart_list:*", "product_list:*", "cache_variants:*"):
+                cache.delete_pattern(pattern)
+            cache.metrics.reset()
+
+            client = APIClient()
+            for user in users:
+                client.force_authenticate(user)
+                client.get("/api/v1/cart/")
+                client.get("/api/v1/cart/")
+            client.force_authenticate(None)
+            rng = random.Random(options["seed"])
+            for _ in range(options["requests"]):
+                client.get(f"/api/v1/product/item/?{noisy_query(rng)}")
+
+            counters = cache.metrics.snapshot()["counters"]
+            for prefix in ("cart_list", "product_list"):
+                values = counters.get(prefix, {"hits": 0, "misses": 0, "hit_ratio": None})
+                self.stdout.write(f"{prefix}: {values['hits']} hits, {values['misses']} misses, hit ratio {values['hit_ratio']}")
+            cache.invalidate_tags(["carts"])
+            cache.bump_generation("catalog")
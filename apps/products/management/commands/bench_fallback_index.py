@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from config.cache import FallbackCache
+from ..benchmark import timed
+
+# nothing listens here, so the cache starts on LocMemCache
+UNREACHABLE_REDIS = "redis://127.0.0.1:1/0"
+
+
+class Command(BaseCommand):
+    help = ("Time FallbackCache writes and pattern deletes while Redis is unreachable, as the number of tracked "
+            "LocMemCache keys grows. Builds its own cache against a closed port, so the configured one is left alone.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="Tracked keys to measure at")
+        parser.add_argument("--writes", type=int, default=1000, help="Writes timed at each size")
+        parser.add_argument("--group", type=int, default=100, help="Entries dropped by each timed delete_pattern")
+
+    def handle(self, *args, **options):
+        sizes = sorted(options["sizes"])
+        cache = FallbackCache("", {"OPTIONS": {
+            "REDIS_BACKEND": {"LOCATION": UNREACHABLE_REDIS},
+            "FALLBACK_BACKEND": {"LOCATION": "bench-fallback-index"},
+            "HEALTH_CHECK_INTERVAL": 3600,
+        }})
+        # keep every key resident; LocMemCache would otherwise cull down to its default 300 entries
+        cache.fallback_cache._max_entries = sizes[-1] + options["writes"] * len(sizes) + options["group"]
+
+        def fill_group():
+            for i in range(options["group"]):
+                cache.set(f"product_list:{i}", i, 600)
+
+        tracked = 0
+        try:
+            for size in sizes:
+                while tracked < size:
+                    cache.set(f"product:{tracked}", tracked, 600)
+                    tracked += 1
+
+                def writes():
+                    nonlocal tracked
+                    for _ in range(options["writes"]):
+                        cache.set(f"product:{tracked}", tracked, 600)
+                        tracked += 1
+
+                write_us = timed(writes) * 1000 / options["writes"]
+                delete_ms = timed(lambda: cache.delete_pattern("product_list:*"), 5, setup=fill_group)
+                self.stdout.write(f"{size} tracked keys: set {write_us:.1f}us, "
+                                  f"delete_pattern of {options['group']} keys {delete_ms:.2f}ms")
+        finally:
+            cache.clear()
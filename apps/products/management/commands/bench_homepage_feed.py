@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from ...feed import HOMEPAGE_FEED_SIZE, build_homepage_feed
+from ...models import Product
+from ..benchmark import benchmark_environment, count_queries, seed_products, timed
+
+PAGE_QUERIES = ["", "page_latest=2&page_size=5", "page_top=3&page_size=5", "page_latest=2&page_top=2&page_size=10"]
+
+
+class Command(BaseCommand):
+    help = ("Time building the homepage feed and serving homepage requests over a seeded catalog, next to the "
+            "ORDER BY RANDOM() pick the feed replaced. Seeds a throwaway test database and uses the configured cache.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=50000, help="Products to seed")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs timed per measurement")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        with benchmark_environment():
+            product_ids = seed_products(options["products"])
+            for position, product_id in enumerate(product_ids[:5], start=1):
+                Product.objects.filter(id=product_id).update(latest_item=True, latest_item_position=position)
+            for position, product_id in enumerate(product_ids[5:10], start=1):
+                Product.objects.filter(id=product_id).update(top_selling_items=True, top_selling_position=position)
+            self.stdout.write(f"{len(product_ids)} products")
+
+            def random_pick():
+                # what each homepage list ran per request before the feed
+                prioritized = Product.objects.filter(latest_item=True, latest_item_position__isnull=False)
+                list(Product.objects.exclude(id__in=prioritized.values_list("id", flat=True))
+                     .order_by("?")[:max(0, HOMEPAGE_FEED_SIZE - prioritized.count())])
+
+            self.stdout.write(f"  ORDER BY RANDOM() pick: {timed(random_pick, repeat):.1f}ms")
+            self.stdout.write(f"  feed build: {timed(build_homepage_feed, repeat):.1f}ms")
+
+            client = APIClient()
+            cache.bump_generation("catalog")
+            for query in PAGE_QUERIES:
+                url = f"/api/v1/product/item/homepage/?{query}"
+                with count_queries() as queries:
+                    cold = timed(lambda: client.get(url))
+                warm = timed(lambda: client.get(url), repeat)
+                self.stdout.write(f"  GET homepage/?{query}: first {cold:.1f}ms ({len(queries)} queries), "
+                                  f"then {warm:.1f}ms")
+            cache.bump_generation("catalog")
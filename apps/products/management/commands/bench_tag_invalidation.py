@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from ..benchmark import timed
+
+
+class Command(BaseCommand):
+    help = ("Compare dropping a group of cached entries by tag against KEYS- and SCAN-based pattern deletes, in a Redis "
+            "that also holds --keys unrelated entries. Needs the cache on Redis; point it at a development instance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=100000, help="Unrelated entries filling the keyspace")
+        parser.add_argument("--group", type=int, default=100, help="Entries in the group being invalidated")
+        parser.add_argument("--repeat", type=int, default=5, help="Invalidations timed per method")
+
+    def handle(self, *args, **options):
+        cache.get("bench_tag:probe")
+        if cache.health()["backend"] != "redis":
+            raise CommandError("The cache is not on Redis; start it, or point CACHES at one")
+        conn = cache.redis_cache.client.get_client(write=True)
+
+        def fill_group():
+            for i in range(options["group"]):
+                cache.set(f"bench_group:{i}", i, 600, tags=["bench_group"])
+
+        def keys_delete():
+            # the pre-tag delete_pattern: one KEYS walk over the whole keyspace
+            keys = conn.keys(cache.redis_cache.make_key("bench_group:*"))
+            if keys:
+                conn.delete(*keys)
+
+        methods = [
+            ("KEYS + DEL", keys_delete),
+            ("delete_pattern (SCAN)", lambda: cache.delete_pattern("bench_group:*")),
+            ("invalidate_tags", lambda: cache.invalidate_tags(["bench_group"])),
+        ]
+        try:
+            for start in range(0, options["keys"], 1000):
+                cache.set_many({f"bench_filler:{i}": i for i in range(start, min(start + 1000, options["keys"]))}, 600)
+            self.stdout.write(f"{conn.dbsize()} keys in Redis, invalidating {options['group']}:")
+            for name, invalidate in methods:
+                elapsed = timed(invalidate, options["repeat"], setup=fill_group)
+                if cache.get("bench_group:0") is not None:
+                    raise CommandError(f"{name} left the group cached")
+                self.stdout.write(f"  {name}: {elapsed:.2f}ms")
+        finally:
+            cache.delete_pattern("bench_filler:*")
+            cache.delete_pattern("bench_group:*")
+            cache.invalidate_tags(["bench_group"])
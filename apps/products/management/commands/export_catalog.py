@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from ...catalog import FORMATS, export_catalog
+
+
+class Command(BaseCommand):
+    help = "Stream every product with its category names and sizes as CSV or JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write; standard output when omitted")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of products read per query")
+
+    def handle(self, *args, **options):
+        chunks = export_catalog(options["format"], options["batch_size"])
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        with open(options["output"], "w", newline="", encoding="utf-8") as stream:
+            stream.writelines(chunks)
+        self.stderr.write(self.style.SUCCESS(f"Exported the catalog to {options['output']}"))
@@ -0,0 +1,29 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from ...catalog import FORMATS, CatalogImporter
+
+
+class Command(BaseCommand):
+    help = "Create or update products, sizes and categories from a CSV or JSONL file, matching products on name"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import")
+        parser.add_argument("--format", choices=FORMATS, help="File format; taken from the file extension when omitted")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of rows written per transaction")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if file_format not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {path}; pass --format {' or '.join(FORMATS)}")
+
+        def progress(report):
+            self.stdout.write(f"{report['rows']} rows: {report['products_created']} products created, {report['products_updated']} updated, {report['errors']} errors")
+
+        with open(path, newline="", encoding="utf-8") as stream:
+            report = CatalogImporter(options["batch_size"], progress).run(stream, file_format)
+        for error in report["error_details"]:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['rows']} rows: {report['products_created']} products created, {report['products_updated']} updated, "
+            f"{report['sizes_created']} sizes created, {report['sizes_updated']} updated, {report['errors']} errors"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ...models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized min_price, min_undiscounted_price, default_size and total_quantity columns on products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of products updated per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        product_ids = list(Product.objects.order_by("id").values_list("id", flat=True))
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                updated += Product.objects.filter(id__in=product_ids[start:start + batch_size]).refresh_pricing()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt pricing for {updated} products"))
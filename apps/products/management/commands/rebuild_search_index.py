@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from django.db import connection, transaction
+from ...models import Product
+from ...search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild Product.search_document and create the full-text index for the active search backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of products updated per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        backend = get_search_backend()
+        with connection.schema_editor() as schema_editor:
+            backend.install(schema_editor)
+        product_ids = list(Product.objects.order_by("id").values_list("id", flat=True))
+        updated = 0
+        for start in range(0, len(product_ids), batch_size):
+            with transaction.atomic():
+                updated += Product.objects.filter(id__in=product_ids[start:start + batch_size]).refresh_search_document(batch_size)
+        cache.bump_generation("catalog")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search documents for {updated} products using {type(backend).__name__}"))
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+from .search import autocomplete_index
 
 SIZE_CHOICES = [
     ('Very Small', 'Very Small'),
@@ -24,6 +26,21 @@ class ProductCategory(models.Model):
     class Meta:
         verbose_name_plural = "product categories"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            if not adding:
+                Product.objects.filter(sub_category__category=self).refresh_search_document()
+        return result
+
+    def delete(self, *args, **kwargs):
+        product_ids = list(Product.objects.filter(sub_category__category=self).values_list("id", flat=True))
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Product.objects.filter(id__in=product_ids).refresh_search_document()
+        return result
+
     def __str__(self):
         return self.name
 
@@ -35,10 +52,60 @@ class ProductSubCategory(models.Model):
     class Meta:
         verbose_name_plural = "product sub-categories"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            if not adding:
+                self.products.all().refresh_search_document()
+        return result
+
+    def delete(self, *args, **kwargs):
+        product_ids = list(self.products.values_list("id", flat=True))
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Product.objects.filter(id__in=product_ids).refresh_search_document()
+        return result
+
     def __str__(self):
         return self.name
 
 
+# denormalized from sizes and left out of a full Product.save()
+PRICING_FIELDS = {"min_price", "min_undiscounted_price", "default_size", "total_quantity"}
+
+
+class ProductQuerySet(models.QuerySet):
+    def refresh_pricing(self):
+        """Recompute the denormalized pricing columns from the cheapest priced size in a single UPDATE."""
+        cheapest_size = ProductSize.objects.filter(product=OuterRef("pk"), price__gt=0).order_by("price", "id")
+        size_totals = ProductSize.objects.filter(product=OuterRef("pk")).order_by().values("product").annotate(total=Sum("quantity")).values("total")
+        return self.update(
+            min_price=Subquery(cheapest_size.values("price")[:1]),
+            min_undiscounted_price=Subquery(cheapest_size.values("undiscounted_price")[:1]),
+            default_size=Subquery(cheapest_size.values("id")[:1]),
+            total_quantity=Subquery(size_totals),
+        )
+
+    def refresh_search_document(self, batch_size=500):
+        """
+        Rebuild search_document from each product's own text, its category names and its size names, and have the
+        autocomplete index pick up the same changes.
+        """
+        updated, batch, product_ids = 0, [], []
+        for product in self.select_related("sub_category__category").prefetch_related("sizes").iterator(chunk_size=batch_size):
+            product.search_document = product.build_search_document([size.size for size in product.sizes.all()])
+            batch.append(product)
+            product_ids.append(product.id)
+            if len(batch) == batch_size:
+                updated += Product.objects.bulk_update(batch, ["search_document"])
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, ["search_document"])
+        autocomplete_index.changed(product_ids)
+        return updated
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField()
@@ -58,11 +125,76 @@ class Product(models.Model):
     date_updated = models.DateField(auto_now=True)
     unlimited = models.BooleanField(default=False)
     production_days = models.PositiveIntegerField(default=0)
+    # denormalized from sizes, kept in sync by ProductSize.save()/delete() and refresh_pricing()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, db_index=True, editable=False)
+    min_undiscounted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    default_size = models.ForeignKey("ProductSize", on_delete=models.SET_NULL, null=True, blank=True, related_name="+", editable=False)
+    total_quantity = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # name, category names, size names and description, indexed by the backends in search.py
+    search_document = models.TextField(blank=True, default="", editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    def build_search_document(self, sizes=None):
+        if sizes is None:
+            sizes = list(self.sizes.values_list("size", flat=True)) if self.pk else []
+        sub_category = self.sub_category
+        parts = [self.name]
+        if sub_category is not None:
+            parts += [sub_category.name, sub_category.category.name]
+        return "\n".join(parts + sizes + [self.description])
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        rebuilt = update_fields is None or {"name", "description", "sub_category"} & set(update_fields)
+        if rebuilt:
+            self.search_document = self.build_search_document()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "search_document"}
+        if update_fields is None and not self._state.adding and not kwargs.get("force_insert"):
+            # the pricing columns may have moved under a concurrent checkout; only refresh_pricing() writes them
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [field.name for field in self._meta.concrete_fields if not field.primary_key
+                                       and field.name not in PRICING_FIELDS and field.attname not in deferred]
+        result = super().save(*args, **kwargs)
+        if rebuilt:
+            autocomplete_index.changed([self.pk])
+        return result
+
+    def delete(self, *args, **kwargs):
+        product_id = self.pk
+        result = super().delete(*args, **kwargs)
+        autocomplete_index.changed([product_id])
+        return result
 
     def __str__(self):
         return self.name
 
 
+class ProductSizeQuerySet(models.QuerySet):
+    def deduct_stock(self, quantities):
+        """
+        Take {size id: quantity} off stock in one conditional UPDATE, all or nothing.
+
+        Returns the ids of sizes without enough stock; when there are any, nothing is deducted. Like any
+        queryset update this skips save(), so callers refresh the products' pricing themselves.
+        """
+        if not quantities:
+            return []
+        enough = Q()
+        for size_id, quantity in quantities.items():
+            enough |= Q(id=size_id, quantity__gte=quantity)
+        with transaction.atomic():
+            updated = self.filter(enough).update(quantity=Case(
+                *[When(id=size_id, then=F("quantity") - quantity) for size_id, quantity in quantities.items()],
+                output_field=models.PositiveIntegerField()))
+            if updated == len(quantities):
+                return []
+            transaction.set_rollback(True)
+        stock = dict(self.filter(id__in=quantities).values_list("id", "quantity"))
+        return [size_id for size_id, quantity in quantities.items() if stock.get(size_id) is None or stock[size_id] < quantity]
+
+
 class ProductSize(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sizes")
     size = models.CharField(max_length=100)
@@ -70,8 +202,36 @@ class ProductSize(models.Model):
     undiscounted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    objects = ProductSizeQuerySet.as_manager()
+
     class Meta:
         constraints = [models.UniqueConstraint(fields=['product', 'size'], name='unique_product_size')]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_size = instance.__dict__.get("size")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # stock-only saves (checkout, refunds) leave the search document alone
+        renamed = self._state.adding or self.size != getattr(self, "_loaded_size", None)
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            products = Product.objects.filter(pk=self.product_id)
+            products.refresh_pricing()
+            if renamed:
+                products.refresh_search_document()
+        self._loaded_size = self.size
+        return result
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            products = Product.objects.filter(pk=self.product_id)
+            products.refresh_pricing()
+            products.refresh_search_document()
+        return result
+
     def __str__(self):
         return f"{self.product.name} -- {self.size}"
@@ -1,8 +1,8 @@
-from rest_framework.pagination import PageNumberPagination
 from drf_yasg import openapi
+from config.pagination import OptionalKeysetPagination
 
 
-class CustomPagination(PageNumberPagination):
+class CustomPagination(OptionalKeysetPagination):
     page_size_query_param = "page_size"
     max_page_size = 100
 
@@ -19,7 +19,34 @@ PAGINATION_PARAMS = [
         openapi.IN_QUERY,
         description="Items per page (max: 100)",
         type=openapi.TYPE_INTEGER
-    )
+    ),
+    openapi.Parameter(
+        'pagination',
+        openapi.IN_QUERY,
+        description="Set to 'cursor' for keyset pagination on listings that support it",
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        'cursor',
+        openapi.IN_QUERY,
+        description="Opaque cursor from a keyset-paginated response's next/previous link",
+        type=openapi.TYPE_STRING
+    ),
+]
+
+PRODUCT_FIELDSET_PARAMS = [
+    openapi.Parameter(
+        'view',
+        openapi.IN_QUERY,
+        description="Set to 'lite' for the compact id/name/image1/price representation",
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        'fields',
+        openapi.IN_QUERY,
+        description="Comma-separated product fields to return, e.g. id,name,price",
+        type=openapi.TYPE_STRING
+    ),
 ]
 
 PRODUCT_PAGINATION_PARAMS = [
@@ -41,6 +68,18 @@ PRODUCT_PAGINATION_PARAMS = [
         description="Items per page (max: 100)",
         type=openapi.TYPE_INTEGER
     ),
+    openapi.Parameter(
+        'pagination',
+        openapi.IN_QUERY,
+        description="Set to 'cursor' for keyset pagination on listings that support it",
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        'cursor',
+        openapi.IN_QUERY,
+        description="Opaque cursor from a keyset-paginated response's next/previous link",
+        type=openapi.TYPE_STRING
+    ),
     # Filter fields from ProductFilter
     openapi.Parameter(
         'sub_category',
@@ -90,4 +129,5 @@ PRODUCT_PAGINATION_PARAMS = [
         description="Filter by discounted items",
         type=openapi.TYPE_BOOLEAN
     ),
-]
\ No newline at end of file
+    *PRODUCT_FIELDSET_PARAMS,
+]
@@ -0,0 +1,329 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r"\w+")
+PREFIX_MATCH_WEIGHT = 0.5
+# long enough for every process to pick up a published autocomplete change; one that misses it rebuilds
+AUTOCOMPLETE_CHANGE_TTL = 60 * 60
+# more changed products than this since a process's last lookup and it rebuilds its index instead
+MAX_INCREMENTAL_PRODUCTS = 500
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def index_names(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        return schema_editor.connection.introspection.get_constraints(cursor, table)
+
+
+class SearchBackend:
+    """
+    Ranks products against Product.search_document. search() returns them best match first, each with a
+    search_rank: the queryset annotated with it, or RankedResults.
+    """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def install(self, schema_editor):
+        """Create whatever index the backend needs; safe to run repeatedly."""
+
+
+class PostgresSearchBackend(SearchBackend):
+    index_name = "product_search_document_gin"
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector("search_document", config="simple")
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        search_query = SearchQuery(" & ".join(f"{term}:*" for term in terms), search_type="raw", config="simple")
+        return queryset.annotate(search=self.vector()).filter(search=search_query).annotate(
+            search_rank=SearchRank(self.vector(), search_query)).order_by("-search_rank", "id")
+
+    def install(self, schema_editor):
+        from django.contrib.postgres.indexes import GinIndex
+        from .models import Product
+        if self.index_name in index_names(schema_editor, Product._meta.db_table):
+            return
+        # built from the same expression search() filters on, so the planner can use it
+        schema_editor.add_index(Product, GinIndex(self.vector(), name=self.index_name))
+
+
+class MySQLSearchBackend(SearchBackend):
+    index_name = "product_search_document_ft"
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        match = "MATCH(search_document) AGAINST (%s IN BOOLEAN MODE)"
+        boolean_query = " ".join(f"+{term}*" for term in terms)
+        return queryset.annotate(search_rank=RawSQL(match, (boolean_query,), output_field=FloatField())).filter(
+            search_rank__gt=0).order_by("-search_rank", "id")
+
+    def install(self, schema_editor):
+        from .models import Product
+        table = Product._meta.db_table
+        if self.index_name in index_names(schema_editor, table):
+            return
+        schema_editor.execute(f"ALTER TABLE {schema_editor.quote_name(table)} ADD FULLTEXT INDEX {schema_editor.quote_name(self.index_name)} (search_document)")
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """In-process tf-idf index for databases without full-text support, rebuilt when the catalog generation moves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.postings = {}
+        self.terms = []
+        self.idf = {}
+
+    def build(self):
+        from .models import Product
+        postings = defaultdict(dict)
+        documents = 0
+        for product_id, document in Product.objects.values_list("id", "search_document").iterator():
+            documents += 1
+            for term in tokenize(document):
+                postings[term][product_id] = postings[term].get(product_id, 0) + 1
+        self.postings = dict(postings)
+        self.terms = sorted(self.postings)
+        self.idf = {term: math.log(1 + documents / len(ids)) for term, ids in self.postings.items()}
+
+    def refresh(self):
+        generation = cache.get_generation("catalog")
+        if generation != self.generation:
+            with self.lock:
+                if generation != self.generation:
+                    self.build()
+                    self.generation = generation
+
+    def expand(self, prefix):
+        start = bisect_left(self.terms, prefix)
+        for term in self.terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        self.refresh()
+        scores = None
+        for prefix in terms:
+            term_scores = defaultdict(float)
+            for term in self.expand(prefix):
+                # whole-word matches outrank words that only start with the query term
+                weight = self.idf[term] if term == prefix else self.idf[term] * PREFIX_MATCH_WEIGHT
+                for product_id, frequency in self.postings[term].items():
+                    term_scores[product_id] = max(term_scores[product_id], frequency * weight)
+            # every query term has to match, as with the database backends
+            scores = term_scores if scores is None else {pk: score + term_scores[pk] for pk, score in scores.items() if pk in term_scores}
+            if not scores:
+                return queryset.none()
+        if queryset.query.has_filters():
+            allowed = set(queryset.values_list("id", flat=True))
+            scores = {pk: score for pk, score in scores.items() if pk in allowed}
+        return RankedResults(queryset, scores)
+
+
+class RankedResults:
+    """
+    Matches ranked in Python and sliced before they reach the database, so a page costs one query on its own ids
+    however many products match. Paginators slice it like a queryset.
+    """
+    chunk_size = 500
+
+    def __init__(self, queryset, scores):
+        self.queryset = queryset
+        self.scores = scores
+        self.ranked = sorted(scores, key=lambda pk: (-scores[pk], pk))
+
+    def count(self):
+        return len(self.ranked)
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.fetch(self.ranked[index])
+        return self.fetch([self.ranked[index]])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self.ranked), self.chunk_size):
+            yield from self.fetch(self.ranked[start:start + self.chunk_size])
+
+    def fetch(self, product_ids):
+        products = self.queryset.in_bulk(product_ids)
+        page = [products[pk] for pk in product_ids if pk in products]
+        for product in page:
+            product.search_rank = self.scores[product.pk]
+        return page
+
+
+class AutocompleteIndex:
+    """
+    Sorted labels and in-label word starts for keystroke lookups by bisect.
+
+    A label is counted once per product it comes from (the product's name, subcategory, category and sizes) and
+    leaves the index when no product has it any more. Catalog writes publish the ids of the products they touched
+    through the cache; each process re-reads just those products on its next lookup, and rebuilds in full only
+    when it has fallen behind what was published.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.product_labels = {}
+        self.counts = defaultdict(int)
+        self.labels = []
+        self.words = []
+
+    def load(self, product_ids=None):
+        """Labels per product, for the whole catalog or for `product_ids`; products that no longer exist are left out."""
+        from .models import Product, ProductSize
+        products, sizes = Product.objects.all(), ProductSize.objects.all()
+        if product_ids is not None:
+            products, sizes = products.filter(id__in=product_ids), sizes.filter(product_id__in=product_ids)
+        labels = defaultdict(set)
+        for product_id, *names in products.values_list("id", "name", "sub_category__name", "sub_category__category__name").iterator():
+            labels[product_id].update(names)
+        for product_id, size in sizes.values_list("product_id", "size").iterator():
+            labels[product_id].add(size)
+        return {product_id: tuple(names - {None, ""}) for product_id, names in labels.items()}
+
+    def label_entry(self, label):
+        return label.lower(), label
+
+    def word_entries(self, label):
+        return [(label[match.start():].lower(), label) for match in TOKEN_RE.finditer(label) if match.start()]
+
+    def build(self):
+        self.product_labels = self.load()
+        self.counts = defaultdict(int)
+        for names in self.product_labels.values():
+            for label in names:
+                self.counts[label] += 1
+        self.labels = sorted(self.label_entry(label) for label in self.counts)
+        self.words = sorted(entry for label in self.counts for entry in self.word_entries(label))
+
+    def update(self, product_ids):
+        loaded = self.load(product_ids)
+        # lookups keep reading the old lists while the new ones are put together
+        labels, words = list(self.labels), list(self.words)
+        for product_id in product_ids:
+            old = set(self.product_labels.pop(product_id, ()))
+            new = set(loaded.get(product_id, ()))
+            if new:
+                self.product_labels[product_id] = tuple(new)
+            for label in new - old:
+                self.counts[label] += 1
+                if self.counts[label] == 1:
+                    insort(labels, self.label_entry(label))
+                    for entry in self.word_entries(label):
+                        insort(words, entry)
+            for label in old - new:
+                self.counts[label] -= 1
+                if self.counts[label] == 0:
+                    del self.counts[label]
+                    discard_sorted(labels, self.label_entry(label))
+                    for entry in self.word_entries(label):
+                        discard_sorted(words, entry)
+        self.labels, self.words = labels, words
+
+    def published_changes(self, version):
+        """Ids of the products changed between this process's version and `version`, or None when it has to rebuild."""
+        if self.version is None or not self.version < version <= self.version + MAX_INCREMENTAL_PRODUCTS:
+            return None
+        keys = [f"autocomplete_change:{number}" for number in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            return None
+        product_ids = set().union(*changes.values())
+        return product_ids if len(product_ids) <= MAX_INCREMENTAL_PRODUCTS else None
+
+    def refresh(self):
+        version = cache.get_generation("autocomplete")
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    product_ids = self.published_changes(version)
+                    if product_ids is None:
+                        self.build()
+                    else:
+                        self.update(product_ids)
+                    self.version = version
+
+    def changed(self, product_ids):
+        """Publish, once the current transaction commits, that these products' labels may have changed."""
+        product_ids = list(product_ids)
+        if product_ids:
+            transaction.on_commit(lambda: self.publish(product_ids))
+
+    def publish(self, product_ids):
+        version = cache.bump_generation("autocomplete")
+        if version is not None:
+            cache.set(f"autocomplete_change:{version}", product_ids, AUTOCOMPLETE_CHANGE_TTL)
+
+    def scan(self, entries, prefix, limit, seen):
+        matches = []
+        for index in range(bisect_left(entries, (prefix,)), len(entries)):
+            key, label = entries[index]
+            if not key.startswith(prefix) or len(matches) == limit:
+                break
+            if label not in seen:
+                seen.add(label)
+                matches.append(label)
+        return matches
+
+    def suggest(self, query, limit=20):
+        """Labels starting with the query, then labels with a later word starting with it."""
+        prefix = query.lower()
+        self.refresh()
+        seen = set()
+        starts_with = self.scan(self.labels, prefix, limit, seen)
+        return starts_with + self.scan(self.words, prefix, limit - len(starts_with), seen)
+
+
+def discard_sorted(entries, entry):
+    index = bisect_left(entries, entry)
+    if index < len(entries) and entries[index] == entry:
+        del entries[index]
+
+
+autocomplete_index = AutocompleteIndex()
+
+VENDOR_BACKENDS = {
+    "postgresql": PostgresSearchBackend,
+    "mysql": MySQLSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, "PRODUCT_SEARCH_BACKEND", None)
+        backend_class = import_string(backend_path) if backend_path else VENDOR_BACKENDS.get(connection.vendor, InvertedIndexSearchBackend)
+        _backend = backend_class()
+    return _backend
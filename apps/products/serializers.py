@@ -1,4 +1,3 @@
-from django.db.models import Sum, Min
 from rest_framework import serializers
 from .models import Product, ProductSubCategory, ProductCategory, ProductSize
 
@@ -46,15 +45,24 @@ class ProductSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "date_created", "date_updated"]
 
     def get_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.price if min_price_size else 0
+        return obj.min_price or 0
 
     def get_undiscounted_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.undiscounted_price if min_price_size and min_price_size.undiscounted_price is not None else 0
+        return obj.min_undiscounted_price or 0
 
 
-class ProductViewSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Keeps only the fields named in the `fields` serializer context entry, when one is given."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ProductViewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     sub_category = ProductSubCategoryViewSerializer()
     total_quantity = serializers.SerializerMethodField()
     price = serializers.SerializerMethodField()
@@ -68,19 +76,44 @@ class ProductViewSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "date_created", "date_updated"]
 
     def get_total_quantity(self, obj):
-        return obj.sizes.aggregate(total=Sum("quantity"))["total"] or None
+        return obj.total_quantity or None
 
     def get_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.price if min_price_size else None
+        return obj.min_price
 
     def get_undiscounted_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.undiscounted_price if min_price_size and min_price_size.undiscounted_price is not None else None
+        return obj.min_undiscounted_price
 
     def get_default_size_id(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.id if min_price_size and min_price_size.id is not None else None
+        return obj.default_size_id
+
+
+class ProductLiteSerializer(serializers.ModelSerializer):
+    price = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ["id", "name", "image1", "price"]
+        read_only_fields = ["id", "name", "image1", "price"]
+
+    def get_price(self, obj):
+        return obj.min_price
+
+
+# columns each ProductViewSerializer field reads, where they differ from the field name
+PRODUCT_FIELD_COLUMNS = {
+    "price": ["min_price"],
+    "undiscounted_price": ["min_undiscounted_price"],
+    "default_size_id": ["default_size"],
+    "sub_category": ["sub_category__name", "sub_category__category__name"],
+}
+
+
+def product_columns(fields):
+    columns = {"id"}
+    for name in fields:
+        columns.update(PRODUCT_FIELD_COLUMNS.get(name, [name]))
+    return columns
 
 
 class ProductSimpleViewSerializer(serializers.ModelSerializer):
@@ -93,12 +126,10 @@ class ProductSimpleViewSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "name", "image1", "price", "undiscounted_price"]
 
     def get_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.price if min_price_size else 0
+        return obj.min_price or 0
 
     def get_undiscounted_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.undiscounted_price if min_price_size and min_price_size.undiscounted_price is not None else 0
+        return obj.min_undiscounted_price or 0
 
 
 class ProductSizeSerializer(serializers.ModelSerializer):
@@ -143,16 +174,13 @@ class ProductDetailViewSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "date_created", "date_updated"]
 
     def get_total_quantity(self, obj):
-        return obj.sizes.aggregate(total=Sum("quantity"))["total"] or None
+        return obj.total_quantity or None
 
     def get_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.price if min_price_size else None
+        return obj.min_price
 
     def get_undiscounted_price(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.undiscounted_price if min_price_size and min_price_size.undiscounted_price is not None else None
+        return obj.min_undiscounted_price
 
     def get_default_size_id(self, obj):
-        min_price_size = obj.sizes.filter(price__gt=0).order_by("price").first()
-        return min_price_size.id if min_price_size and min_price_size.id is not None else None
+        return obj.default_size_id
@@ -0,0 +1,129 @@
+import heapq
+import random
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from .models import Product, ProductSubCategory
+
+SUGGESTION_LIMIT = 20
+
+# top-selling first, then latest, as pool_rank() orders them in Python
+POOL_ORDERING = [
+    F("top_selling_items").desc(),
+    F("latest_item").desc(),
+    F("id").asc(),
+]
+
+
+def pool_rank(top_selling, latest, product_id):
+    return (not top_selling, not latest, product_id)
+
+
+def merge_pools(pools, exclude=(), limit=SUGGESTION_LIMIT):
+    # pools are already ranked, so merging their heads gives the ranking of their union
+    return list(islice((entry for entry in heapq.merge(*pools) if entry[2] not in exclude), limit))
+
+
+class SuggestionPools:
+    """Top ranked (rank, id) entries per subcategory and per category, cached per catalog generation."""
+
+    def __init__(self):
+        self.generation = cache.get_generation("catalog")
+        self.timeout = int(settings.CACHE_TIMEOUT)
+
+    def key(self, kind, pk):
+        return f"suggestion_pool:{self.generation}:{kind}:{pk}"
+
+    def subcategories(self):
+        key = self.key("subcategories", "all")
+        category_of = cache.get(key)
+        if category_of is None:
+            category_of = dict(ProductSubCategory.objects.values_list("id", "category_id"))
+            cache.set(key, category_of, self.timeout)
+        return category_of
+
+    def for_subcategories(self, sub_category_ids):
+        keys = {sub_category_id: self.key("sub", sub_category_id) for sub_category_id in sub_category_ids}
+        cached = cache.get_many(list(keys.values()))
+        pools = {sub_category_id: cached[key] for sub_category_id, key in keys.items() if key in cached}
+        missing = [sub_category_id for sub_category_id in keys if sub_category_id not in pools]
+        if missing:
+            pools.update(self.build_subcategory_pools(missing))
+            cache.set_many({keys[sub_category_id]: pools[sub_category_id] for sub_category_id in missing}, self.timeout)
+        return pools
+
+    def build_subcategory_pools(self, sub_category_ids):
+        """Top entries of every requested subcategory (None for products without one) in one windowed query."""
+        pools = {sub_category_id: [] for sub_category_id in sub_category_ids}
+        scope = Q(sub_category_id__in=[pk for pk in sub_category_ids if pk is not None])
+        if None in pools:
+            scope |= Q(sub_category__isnull=True)
+        rows = Product.objects.filter(scope).annotate(
+            pool_position=Window(RowNumber(), partition_by=F("sub_category_id"), order_by=POOL_ORDERING)
+        ).filter(pool_position__lte=SUGGESTION_LIMIT).values_list("sub_category_id", "top_selling_items", "latest_item", "id")
+        for sub_category_id, top_selling, latest, product_id in rows:
+            pools[sub_category_id].append(pool_rank(top_selling, latest, product_id))
+        for pool in pools.values():
+            pool.sort()
+        return pools
+
+    def for_categories(self, category_ids):
+        keys = {category_id: self.key("category", category_id) for category_id in category_ids}
+        cached = cache.get_many(list(keys.values()))
+        pools = {category_id: cached[key] for category_id, key in keys.items() if key in cached}
+        missing = [category_id for category_id in keys if category_id not in pools]
+        if missing:
+            category_of = self.subcategories()
+            sub_category_pools = self.for_subcategories([pk for pk, category_id in category_of.items() if category_id in missing])
+            for category_id in missing:
+                pools[category_id] = merge_pools(pool for pk, pool in sub_category_pools.items() if category_of[pk] == category_id)
+            cache.set_many({keys[category_id]: pools[category_id] for category_id in missing}, self.timeout)
+        return pools
+
+    def weighted(self, sub_category_id=None, second_sub_category_id=None):
+        """Ranked candidate ids with their weights: each subcategory, the rest of its category, then the rest of the catalog."""
+        category_of = self.subcategories()
+        targets = [(sub_category_id, 0.4, 0.2)]
+        if second_sub_category_id != sub_category_id:
+            targets.append((second_sub_category_id, 0.25, 0.1))
+        targets = [target for target in targets if target[0]]
+        for target_id, _, _ in targets:
+            if target_id not in category_of:
+                raise ProductSubCategory.DoesNotExist
+        used_category_ids = {category_of[target_id] for target_id, _, _ in targets}
+        sub_category_pools = self.for_subcategories([pk for pk, category_id in category_of.items() if category_id in used_category_ids])
+        pools = []
+        for target_id, sub_category_weight, category_weight in targets:
+            siblings = [pool for pk, pool in sub_category_pools.items() if category_of[pk] == category_of[target_id] and pk != target_id]
+            pools.append((sub_category_pools[target_id], sub_category_weight))
+            pools.append((merge_pools(siblings), category_weight))
+        other_categories = self.for_categories(set(category_of.values()) - used_category_ids)
+        uncategorized = self.for_subcategories([None])[None]
+        pools.append((merge_pools([*other_categories.values(), uncategorized]), 0.05))
+        return [([entry[2] for entry in pool], weight) for pool, weight in pools]
+
+    def sample(self, limit=SUGGESTION_LIMIT):
+        candidates = {entry[2] for pool in self.for_categories(set(self.subcategories().values())).values() for entry in pool}
+        candidates.update(entry[2] for entry in self.for_subcategories([None])[None])
+        return random.sample(sorted(candidates), min(limit, len(candidates)))
+
+
+def weighted_interleave(pools, limit=SUGGESTION_LIMIT):
+    """Fill `limit` slots by drawing a pool by weight for each slot and taking its best id not already chosen."""
+    positions = [0] * len(pools)
+    live = [index for index, (ids, weight) in enumerate(pools) if ids and weight > 0]
+    selected, seen = [], set()
+    while len(selected) < limit and live:
+        index = random.choices(live, weights=[pools[i][1] for i in live])[0]
+        ids, position = pools[index][0], positions[index]
+        while position < len(ids) and ids[position] in seen:
+            position += 1
+        positions[index] = position + 1
+        if position >= len(ids):
+            live.remove(index)
+            continue
+        seen.add(ids[position])
+        selected.append(ids[position])
+    return selected
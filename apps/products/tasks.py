@@ -0,0 +1,15 @@
+from celery import shared_task
+from .catalog import run_stored_import
+from .feed import refresh_homepage_feed
+
+
+@shared_task
+def refresh_homepage_feed_task():
+    feed = refresh_homepage_feed()
+    return {"status": "success", "latest_items": len(feed["latest_items"]), "top_selling_items": len(feed["top_selling_items"])}
+
+
+@shared_task
+def import_catalog_task(path, file_format, job_id):
+    report = run_stored_import(path, file_format, job_id)
+    return {"status": "success", "job_id": job_id, "rows": report["rows"], "errors": report["errors"]}
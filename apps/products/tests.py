@@ -0,0 +1,300 @@
+import base64
+import csv
+import io
+import json
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from .catalog import CSV_COLUMNS, CatalogImporter, export_catalog
+from .models import Product, ProductCategory, ProductSize, ProductSubCategory
+from .search import AutocompleteIndex, InvertedIndexSearchBackend
+from .suggestions import SUGGESTION_LIMIT, SuggestionPools
+
+
+class AutocompleteIndexTests(TestCase):
+    def setUp(self):
+        category = ProductCategory.objects.create(name="Clothing")
+        self.sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        self.shirt = self.create_product("Linen Shirt")
+        self.hat = self.create_product("Straw Hat")
+        self.index = AutocompleteIndex()
+        self.index.refresh()
+
+    def create_product(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name=name, description="", colour="White", sub_category=self.sub_category,
+                                             image1="product_images/product.jpg")
+            ProductSize.objects.create(product=product, size="Medium", quantity=1, price=Decimal("10.00"))
+        return product
+
+    def test_suggests_labels_then_later_words(self):
+        self.assertEqual(self.index.suggest("s"), ["Shirts", "Straw Hat", "Linen Shirt"])
+        self.assertEqual(self.index.suggest("cl"), ["Clothing"])
+        self.assertEqual(self.index.suggest("med"), ["Medium"])
+
+    def test_catalog_writes_are_applied_without_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.name = "Cotton Shirt"
+            self.shirt.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hat.delete()
+        with mock.patch.object(AutocompleteIndex, "build") as build:
+            self.assertEqual(self.index.suggest("cot"), ["Cotton Shirt"])
+            self.assertEqual(self.index.suggest("lin"), [])
+            self.assertEqual(self.index.suggest("straw"), [])
+            # still carried by the shirt
+            self.assertEqual(self.index.suggest("med"), ["Medium"])
+        build.assert_not_called()
+
+    def test_stock_and_catalog_generation_changes_cost_no_query(self):
+        ProductSize.objects.deduct_stock({self.shirt.sizes.get().id: 1})
+        cache.bump_generation("catalog")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.suggest("lin"), ["Linen Shirt"])
+
+    def test_rebuilds_when_published_changes_are_gone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product("Wool Scarf")
+        cache.delete(f"autocomplete_change:{cache.get_generation('autocomplete')}")
+        self.assertEqual(self.index.suggest("wool"), ["Wool Scarf"])
+
+
+class SuggestionPoolTests(TestCase):
+    def test_pool_keeps_top_selling_then_latest_products(self):
+        category = ProductCategory.objects.create(name="Clothing")
+        sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        ids = [Product.objects.create(name=f"Shirt {i}", description="", colour="White", sub_category=sub_category,
+                                      image1="product_images/product.jpg").id for i in range(SUGGESTION_LIMIT + 5)]
+        Product.objects.filter(id__in=ids[-2:]).update(top_selling_items=True)
+        Product.objects.filter(id__in=[ids[-1], ids[-3]]).update(latest_item=True)
+
+        pool = SuggestionPools().build_subcategory_pools([sub_category.id])[sub_category.id]
+        self.assertEqual(len(pool), SUGGESTION_LIMIT)
+        self.assertEqual([entry[2] for entry in pool[:4]], [ids[-1], ids[-2], ids[-3], ids[0]])
+
+
+class ProductKeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.bump_generation("catalog")
+        category = ProductCategory.objects.create(name="Clothing")
+        sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        flags = [(False, False), (True, False), (False, True), (False, False), (True, True), (False, False), (True, False)]
+        for i, (top_selling, latest) in enumerate(flags):
+            Product.objects.create(name=f"Shirt {i}", description="", colour="White", sub_category=sub_category,
+                                   image1="product_images/product.jpg", top_selling_items=top_selling, latest_item=latest)
+        self.expected = list(Product.objects.order_by("top_selling_items", "latest_item", "id").values_list("id", flat=True))
+
+    def walk(self, url, link):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            page = [product["id"] for product in data["results"]]
+            ids = ids + page if link == "next" else page + ids
+            url, pages = data[link], pages + 1
+        return ids, pages
+
+    def test_pages_forward_and_back_across_tied_sort_keys(self):
+        ids, pages = self.walk("/api/v1/product/item/?pagination=cursor&page_size=2", "next")
+        self.assertEqual((ids, pages), (self.expected, 4))
+
+        last = self.client.get("/api/v1/product/item/?pagination=cursor&page_size=2").json()
+        while last["next"]:
+            last = self.client.get(last["next"]).json()
+        ids, pages = self.walk(last["previous"], "previous")
+        self.assertEqual(ids, self.expected[:-1])
+
+    def test_malformed_cursor_is_not_found(self):
+        for values in ([{"a": 1}, {"b": 2}, "x"], ["notabool", "x", "y"], [True, False, None], [True, False]):
+            cursor = base64.urlsafe_b64encode(json.dumps({"v": values, "r": False}).encode()).decode()
+            response = self.client.get(f"/api/v1/product/item/?pagination=cursor&cursor={cursor}")
+            self.assertEqual(response.status_code, 404, values)
+        self.assertEqual(self.client.get("/api/v1/product/item/?pagination=cursor&cursor=not-base64").status_code, 404)
+
+
+class ProductConditionalRequestTests(TestCase):
+    def setUp(self):
+        cache.bump_generation("catalog")
+        category = ProductCategory.objects.create(name="Clothing")
+        sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        # enough products for a body that is stored compressed
+        for i in range(10):
+            Product.objects.create(name=f"Shirt {i}", description="A plain cotton shirt " * 5, colour="White",
+                                   sub_category=sub_category, image1="product_images/product.jpg")
+
+    def test_cached_reads_carry_validators(self):
+        response = self.client.get("/api/v1/product/item/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(response["Cache-Control"], "public, max-age=60")
+        self.assertEqual(len(response.json()["results"]), 10)
+        # served from the cache, byte for byte
+        self.assertEqual(self.client.get("/api/v1/product/item/").content, response.content)
+
+    def test_matching_etag_answers_not_modified(self):
+        etag = self.client.get("/api/v1/product/item/")["ETag"]
+        response = self.client.get("/api/v1/product/item/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get("/api/v1/product/item/", HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_browsable_api_gets_rendered_data(self):
+        self.client.get("/api/v1/product/item/")
+        response = self.client.get("/api/v1/product/item/", HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/html"))
+        self.assertNotIn("ETag", response)
+        self.assertContains(response, "Shirt 0")
+
+
+class ProductPricingTests(TestCase):
+    def test_full_save_keeps_pricing_refreshed_meanwhile(self):
+        category = ProductCategory.objects.create(name="Clothing")
+        sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        product = Product.objects.create(name="Linen Shirt", description="", colour="White", sub_category=sub_category,
+                                         image1="product_images/product.jpg")
+        size = ProductSize.objects.create(product=product, size="Medium", quantity=5, price=Decimal("10.00"))
+        product.refresh_from_db()
+
+        # a checkout deducts stock and refreshes pricing while an admin edits the loaded product
+        ProductSize.objects.deduct_stock({size.id: 2})
+        Product.objects.filter(id=product.id).refresh_pricing()
+        product.name = "Linen Shirt (new)"
+        product.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.name, "Linen Shirt (new)")
+        self.assertEqual((product.total_quantity, product.min_price, product.default_size_id), (3, Decimal("10.00"), size.id))
+
+
+class InvertedIndexSearchTests(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create([
+            Product(name=f"Shirt {i}", description="", colour="White", image1="product_images/product.jpg",
+                    search_document=f"Shirt {i}\n{'Linen shirt' if i % 2 else 'Cotton'}")
+            for i in range(1200)
+        ])
+        self.backend = InvertedIndexSearchBackend()
+
+    def test_ranks_in_python_and_queries_only_the_page(self):
+        results = self.backend.search(Product.objects.all(), "shirt")
+        self.assertEqual(results.count(), 1200)
+        params = []
+
+        def record(execute, sql, query_params, many, context):
+            params.extend(query_params)
+            return execute(sql, query_params, many, context)
+
+        with self.assertNumQueries(1), connection.execute_wrapper(record):
+            page = results[10:20]
+        self.assertEqual(len(params), 10)
+        # odd products mention "shirt" twice, so they all rank first
+        self.assertEqual([product.name for product in page], [f"Shirt {i}" for i in range(21, 40, 2)])
+        self.assertTrue(all(product.search_rank > 0 for product in page))
+
+    def test_respects_a_filtered_queryset(self):
+        queryset = Product.objects.filter(name__in=["Shirt 1", "Shirt 2"])
+        results = self.backend.search(queryset, "lin")
+        self.assertEqual([product.name for product in results], ["Shirt 1"])
+
+    def test_search_endpoint_pages_ranked_results(self):
+        cache.bump_generation("catalog")
+        with mock.patch("apps.products.views.get_search_backend", return_value=self.backend):
+            data = self.client.get("/api/v1/product/item/search/?search=shirt&page=2&page_size=5").json()
+        self.assertEqual(data["count"], 1200)
+        self.assertEqual([product["name"] for product in data["results"]], [f"Shirt {i}" for i in range(11, 20, 2)])
+
+
+def csv_stream(rows):
+    stream = io.StringIO()
+    writer = csv.DictWriter(stream, CSV_COLUMNS, restval="")
+    writer.writeheader()
+    writer.writerows(rows)
+    stream.seek(0)
+    return stream
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        category = ProductCategory.objects.create(name="Clothing")
+        sub_category = ProductSubCategory.objects.create(name="Shirts", category=category)
+        self.shirt = Product.objects.create(name="Linen Shirt", description="", colour="White", sub_category=sub_category,
+                                            image1="product_images/product.jpg")
+        ProductSize.objects.create(product=self.shirt, size="M", quantity=5, price=Decimal("10.00"))
+        self.rows = [
+            {"name": "Linen Shirt", "size": "M", "quantity": 5, "price": "12.00"},
+            # a second row for the same product in the batch adds a size
+            {"name": "Linen Shirt", "size": "L", "quantity": 2, "price": "8.00"},
+            {"name": "Straw Hat", "description": "Wide brim", "colour": "Beige", "image1": "product_images/hat.jpg",
+             "category": "Accessories", "sub_category": "Hats", "size": "One", "quantity": 3, "price": "5.00"},
+        ]
+
+    def test_creates_and_updates_products_matched_on_name(self):
+        report = CatalogImporter().run(csv_stream(self.rows), "csv")
+        self.assertEqual({key: report[key] for key in ("rows", "products_created", "products_updated", "sizes_created", "sizes_updated", "errors")},
+                         {"rows": 3, "products_created": 1, "products_updated": 0, "sizes_created": 2, "sizes_updated": 1, "errors": 0})
+        self.assertEqual(Product.objects.count(), 2)
+
+        # pricing and search documents were refreshed for the changed products
+        self.shirt.refresh_from_db()
+        self.assertEqual((self.shirt.min_price, self.shirt.default_size.size, self.shirt.total_quantity), (Decimal("8.00"), "L", 7))
+        hat = Product.objects.get(name="Straw Hat")
+        self.assertEqual((hat.min_price, hat.sub_category.name, hat.sub_category.category.name), (Decimal("5.00"), "Hats", "Accessories"))
+        self.assertIn("Hats", hat.search_document)
+
+    def test_unchanged_rows_are_skipped(self):
+        CatalogImporter().run(csv_stream(self.rows), "csv")
+        with mock.patch.object(Product.objects, "bulk_update") as products_update, \
+                mock.patch.object(ProductSize.objects, "bulk_update") as sizes_update:
+            report = CatalogImporter().run(csv_stream(self.rows), "csv")
+        products_update.assert_not_called()
+        sizes_update.assert_not_called()
+        self.assertEqual([report[key] for key in ("products_created", "products_updated", "sizes_created", "sizes_updated")], [0, 0, 0, 0])
+
+    def test_reports_errors_per_line(self):
+        report = CatalogImporter().run(csv_stream([
+            {"name": "Wool Scarf", "description": "Warm", "image1": "product_images/scarf.jpg"},
+            {"name": "Linen Shirt", "size": "M", "price": "abc"},
+            {"description": "No name"},
+            {"name": "Silk Tie", "description": "Red", "colour": "Red", "image1": "product_images/tie.jpg", "sub_category": "Ties"},
+            {"name": "Linen Shirt", "size": "M", "price": "11.00"},
+        ]), "csv")
+        errors = {error["line"]: error["error"] for error in report["error_details"]}
+        self.assertEqual(sorted(errors), [2, 3, 4, 5])
+        self.assertIn("colour", errors[2])
+        self.assertTrue(errors[3].startswith("price:"))
+        self.assertEqual(errors[4], "name is required")
+        self.assertIn("'Ties' does not exist", errors[5])
+        self.assertEqual(report["errors"], 4)
+        self.assertEqual(ProductSize.objects.get(product=self.shirt).price, Decimal("11.00"))
+        self.assertFalse(Product.objects.filter(name__in=["Wool Scarf", "Silk Tie"]).exists())
+
+    def test_export_round_trips_through_import(self):
+        CatalogImporter().run(csv_stream(self.rows), "csv")
+        exported = "".join(export_catalog("csv"))
+        self.assertEqual(len(exported.splitlines()), 4)
+        report = CatalogImporter().run(io.StringIO(exported), "csv")
+        self.assertEqual([report[key] for key in ("rows", "products_updated", "sizes_updated", "errors")], [3, 0, 0, 0])
+
+class DeductStockTests(TestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Linen Shirt", description="", colour="White", image1="product_images/product.jpg")
+        self.medium = ProductSize.objects.create(product=product, size="M", quantity=5, price=Decimal("10.00"))
+        self.large = ProductSize.objects.create(product=product, size="L", quantity=1, price=Decimal("10.00"))
+
+    def quantities(self):
+        return list(ProductSize.objects.order_by("id").values_list("quantity", flat=True))
+
+    def test_deducts_every_size(self):
+        self.assertEqual(ProductSize.objects.deduct_stock({self.medium.id: 2, self.large.id: 1}), [])
+        self.assertEqual(self.quantities(), [3, 0])
+
+    def test_short_size_rolls_back_the_whole_deduction(self):
+        self.assertEqual(ProductSize.objects.deduct_stock({self.medium.id: 2, self.large.id: 2, 999999: 1}), [self.large.id, 999999])
+        self.assertEqual(self.quantities(), [5, 1])
@@ -1,25 +1,26 @@
-import json
-
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.core.cache import cache
+from config.cache_keys import query_cache_key, admit_variant
+from config.response_cache import cached_response
 from .filters import ProductFilter
-from .pagination import CustomPagination
+from .pagination import CustomPagination, PRODUCT_FIELDSET_PARAMS
 from .permissions import IsAdminOrReadOnly
 from .serializers import ProductCategorySerializer, ProductSubCategorySerializer, ProductSerializer, \
     ProductSizeSerializer, ProductViewSerializer, ProductSubCategoryViewSerializer, ProductCategoryDetailSerializer, \
-    ProductSizeViewSerializer, ProductDetailViewSerializer
+    ProductSizeViewSerializer, ProductDetailViewSerializer, ProductLiteSerializer, product_columns
 from .models import Product, ProductSubCategory, ProductCategory, ProductSize
+from .search import get_search_backend, autocomplete_index
+from .feed import get_homepage_feed
+from .suggestions import SUGGESTION_LIMIT, SuggestionPools, weighted_interleave
 from rest_framework import viewsets, status
 from .utils import swagger_helper
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import F, Q, Case, When, Value, BooleanField
+from django.db.models import F, Q, Case, When
 from django.db import transaction
-from itertools import chain
-import random
 
 TIMEOUT = int(settings.CACHE_TIMEOUT)
 
@@ -30,6 +31,7 @@ class ApiProductCategory(viewsets.ModelViewSet):
     pagination_class = CustomPagination
     permission_classes = [IsAdminOrReadOnly]
     search_fields = ["name"]
+    cache_max_age = {"list": 300, "retrieve": 300}
 
     def get_serializer_class(self):
         if self.action == "retrieve":
@@ -38,69 +40,37 @@ class ApiProductCategory(viewsets.ModelViewSet):
 
     @swagger_helper(tags="ProductCategory", model="Product category")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"category_list:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "category_list")
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=["categories"], admit=lambda: admit_variant(request, self, "category_list"))
 
     @swagger_helper(tags="ProductCategory", model="Product category")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"category_detail:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=["categories"])
 
     @swagger_helper(tags="ProductCategory", model="Product category")
     def create(self, *args, **kwargs):
         response = super().create(*args, **kwargs)
-        cache.delete_pattern("category_list:*")
-        cache.delete_pattern("category_detail:*")
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern("subcategory_detail:*")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["categories", "subcategories"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductCategory", model="Product category")
     def partial_update(self, *args, **kwargs):
         response = super().partial_update(*args, **kwargs)
-        cache.delete_pattern("category_list:*")
-        cache.delete_pattern(f"category_detail:{kwargs['pk']}")
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern("subcategory_detail:*")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["categories", "subcategories"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductCategory", model="Product category")
     def destroy(self, *args, **kwargs):
         response = super().destroy(*args, **kwargs)
-        cache.delete_pattern("category_list:*")
-        cache.delete_pattern(f"category_detail:{kwargs['pk']}")
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern("subcategory_detail:*")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["categories", "subcategories"])
+        cache.bump_generation("catalog")
         return response
 
 
@@ -110,6 +80,7 @@ class ApiProductSubCategory(viewsets.ModelViewSet):
     pagination_class = CustomPagination
     permission_classes = [IsAdminOrReadOnly]
     filterset_fields = ["category"]
+    cache_max_age = {"list": 300, "retrieve": 300}
     search_fields = ["name"]
 
     def get_serializer_class(self):
@@ -119,63 +90,37 @@ class ApiProductSubCategory(viewsets.ModelViewSet):
 
     @swagger_helper(tags="ProductSubCategory", model="Product sub category")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"subcategory_list:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "subcategory_list")
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=["subcategories"], admit=lambda: admit_variant(request, self, "subcategory_list"))
 
     @swagger_helper(tags="ProductSubCategory", model="Product sub category")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"subcategory_detail:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=["subcategories"])
 
     @swagger_helper(tags="ProductSubCategory", model="Product sub category")
     def create(self, *args, **kwargs):
         response = super().create(*args, **kwargs)
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern("subcategory_detail:*")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["subcategories"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductSubCategory", model="Product sub category")
     def partial_update(self, *args, **kwargs):
         response = super().partial_update(*args, **kwargs)
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern(f"subcategory_detail:{kwargs['pk']}")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["subcategories"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductSubCategory", model="Product sub category")
     def destroy(self, *args, **kwargs):
         response = super().destroy(*args, **kwargs)
-        cache.delete_pattern("subcategory_list:*")
-        cache.delete_pattern(f"subcategory_detail:{kwargs['pk']}")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["subcategories"])
+        cache.bump_generation("catalog")
         return response
 
 
@@ -187,50 +132,70 @@ class ApiProduct(viewsets.ModelViewSet):
     ordering_fields = ["price", "date_created", "is_available", "latest_item", "top_selling_items"]
     filterset_class = ProductFilter
     ordering = ["top_selling_items", "latest_item"]
+    keyset_ordering = ["top_selling_items", "latest_item", "id"]
+    cache_query_params = {"list": ["view", "fields"], "search": ["search", "view", "fields"],
+                          "suggestions": ["sub_category_id", "second_sub_category_id", "view", "fields"]}
+    # listings that accept ?view=lite or ?fields=
+    sparse_actions = ["list", "search", "homepage", "suggestions"]
+    # stock and prices move with every order; clients revalidate with If-None-Match once these lapse
+    cache_max_age = {"list": 60, "retrieve": 60, "search": 60, "suggestions": 60}
+
+    def get_queryset(self):
+        if self.request.method == "GET":
+            fields = self.get_sparse_fields()
+            if fields is None:
+                return Product.objects.select_related("sub_category__category").alias(price=F("min_price"))
+            queryset = Product.objects.only(*product_columns(fields), *(field.lstrip("-") for field in self.keyset_ordering))
+            if "sub_category" in fields:
+                queryset = queryset.select_related("sub_category__category")
+            return queryset.alias(price=F("min_price"))
+        return super().get_queryset()
+
+    def get_sparse_fields(self):
+        """Fields asked for with ?view=lite or ?fields= on a listing, or None for the full representation."""
+        if self.action not in self.sparse_actions:
+            return None
+        if self.request.query_params.get("view") == "lite":
+            return ProductLiteSerializer.Meta.fields
+        requested = {field.strip() for field in self.request.query_params.get("fields", "").split(",")}
+        if not requested & set(ProductViewSerializer.Meta.fields):
+            return None
+        return [name for name in ProductViewSerializer.Meta.fields if name == "id" or name in requested]
 
     def get_serializer_class(self):
         if self.action == "retrieve":
             return ProductDetailViewSerializer
         if self.request.method == "GET":
+            if self.action in self.sparse_actions and self.request.query_params.get("view") == "lite":
+                return ProductLiteSerializer
             return ProductViewSerializer
         return ProductSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request is not None and self.request.method == "GET":
+            context["fields"] = self.get_sparse_fields()
+        return context
+
     @swagger_helper(tags="Product", model="Product")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"product_list:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "product_list")
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               generation=cache.get_generation('catalog'), admit=lambda: admit_variant(request, self, "product_list"))
 
     @swagger_helper(tags="Product", model="Product")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"product_detail:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"product:{kwargs['pk']}"])
 
     @swagger_helper(tags="Product", model="Product")
     def create(self, *args, **kwargs):
         response = super().create(*args, **kwargs)
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("cart_list:*")
-        cache.delete_pattern("cart_item_list:*")
-        cache.delete_pattern("wishlist_list:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags(["carts", "wishlists"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="Product", model="Product")
@@ -278,15 +243,8 @@ class ApiProduct(viewsets.ModelViewSet):
                     )
                 serializer.save()
 
-            cache.delete_pattern("product_list:*")
-            cache.delete_pattern(f"product_detail:{kwargs['pk']}")
-            cache.delete_pattern("search:*")
-            cache.delete_pattern("search_suggestions:*")
-            cache.delete_pattern("cart_list:*")
-            cache.delete_pattern("cart_item_list:*")
-            cache.delete_pattern("wishlist_list:*")
-            cache.delete_pattern("product_suggestions:*")
-            cache.delete_pattern("product_homepage:*")
+            cache.invalidate_tags([f"product:{kwargs['pk']}", "carts", "wishlists"])
+            cache.bump_generation("catalog")
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -294,43 +252,24 @@ class ApiProduct(viewsets.ModelViewSet):
     @swagger_helper(tags="Product", model="Product")
     def destroy(self, *args, **kwargs):
         response = super().destroy(*args, **kwargs)
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern(f"product_detail:{kwargs['pk']}")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("cart_list:*")
-        cache.delete_pattern("cart_item_list:*")
-        cache.delete_pattern("wishlist_list:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags([f"product:{kwargs['pk']}", "carts", "wishlists"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="Product", model="Product")
     @action(methods=['GET'], detail=False)
     def homepage(self, request):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"product_homepage:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        products = Product.objects.select_related('sub_category__category')
-        latest_prioritized = products.filter(Q(latest_item=True) & Q(latest_item_position__isnull=False)).order_by('latest_item_position')
-        random_others = products.exclude(id__in=latest_prioritized.values_list('id', flat=True)).order_by('?')[:max(0, 20 - latest_prioritized.count())]
-        latest_products = list(latest_prioritized) + list(random_others)
-
-        top_selling_prioritized = products.filter(Q(top_selling_items=True) & Q(top_selling_position__isnull=False)).order_by('top_selling_position')
-        other_latest = products.exclude(id__in=top_selling_prioritized.values_list('id', flat=True)).order_by('?')[:max(0, 20 - top_selling_prioritized.count())]
-        top_selling_products = list(top_selling_prioritized) + list(other_latest)
-
+        feed = get_homepage_feed()
         latest_paginator = self.pagination_class()
         top_selling_paginator = self.pagination_class()
         latest_paginator.page_query_param = 'page_latest'
         top_selling_paginator.page_query_param = 'page_top'
 
-        latest_page = latest_paginator.paginate_queryset(latest_products, request, view=self)
-        top_selling_page = top_selling_paginator.paginate_queryset(top_selling_products, request, view=self)
+        latest_ids = latest_paginator.paginate_queryset(feed["latest_items"], request, view=self)
+        top_selling_ids = top_selling_paginator.paginate_queryset(feed["top_selling_items"], request, view=self)
+        products = self.get_queryset().in_bulk(latest_ids + top_selling_ids)
+        latest_page = [products[product_id] for product_id in latest_ids if product_id in products]
+        top_selling_page = [products[product_id] for product_id in top_selling_ids if product_id in products]
 
         latest_serializer = self.get_serializer(latest_page, many=True)
         top_selling_serializer = self.get_serializer(top_selling_page, many=True)
@@ -339,30 +278,21 @@ class ApiProduct(viewsets.ModelViewSet):
             "latest_items": latest_paginator.get_paginated_response(latest_serializer.data).data,
             "top_selling_items": top_selling_paginator.get_paginated_response(top_selling_serializer.data).data
         }
-        cache.set(cache_key, response_data, cache_timeout)
         return Response(response_data)
 
-    @swagger_auto_schema(manual_parameters=[openapi.Parameter('search', openapi.IN_QUERY, description="Search keyword", type=openapi.TYPE_STRING), openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER), openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max: 100)", type=openapi.TYPE_INTEGER)], operation_id="Search Products", operation_description="Search and paginate products", tags=["Product"])
+    @swagger_auto_schema(manual_parameters=[openapi.Parameter('search', openapi.IN_QUERY, description="Search keyword", type=openapi.TYPE_STRING), openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER), openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max: 100)", type=openapi.TYPE_INTEGER), *PRODUCT_FIELDSET_PARAMS], operation_id="Search Products", operation_description="Search and paginate products", tags=["Product"])
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request, *args, **kwargs):
         query = request.query_params.get("search", "").strip()
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"product_search:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
         if not query:
             return Response({"count": 0, "next": None, "previous": None, "results": []})
 
-        search_data = self.get_queryset().filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(sizes__size__icontains=query) |
-            Q(sub_category__name__icontains=query) |
-            Q(sub_category__category__name__icontains=query)
-        ).distinct()
+        cache_key = query_cache_key(request, self, "product_search")
+        return cached_response(request, cache_key, lambda: self.search_results(request, query), TIMEOUT,
+                               generation=cache.get_generation('catalog'), admit=lambda: admit_variant(request, self, "product_search"))
+
+    def search_results(self, request, query):
+        search_data = get_search_backend().search(self.get_queryset(), query)
 
         page = self.paginate_queryset(search_data)
         if page is not None:
@@ -371,9 +301,7 @@ class ApiProduct(viewsets.ModelViewSet):
         else:
             serializer = self.get_serializer(search_data, many=True)
             response_data = serializer.data
-
-        cache.set(cache_key, response_data, cache_timeout)
-        return Response(response_data, status=status.HTTP_200_OK)
+        return response_data
 
     @swagger_auto_schema(manual_parameters=[openapi.Parameter('query', openapi.IN_QUERY, description="autocomplete for search", type=openapi.TYPE_STRING), openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER), openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max: 100)", type=openapi.TYPE_INTEGER)], operation_id="Auocomplete Products", operation_description="Search products for autocomplete", tags=["Product"])
     @action(detail=False, methods=['get'], url_path='autocomplete')
@@ -382,155 +310,37 @@ class ApiProduct(viewsets.ModelViewSet):
         if not query:
             return Response([])
 
-        cache_timeout = TIMEOUT
-        cache_key = f"search_suggestions:{query}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        products = self.get_queryset().filter(
-            Q(name__istartswith=query) |
-            Q(sub_category__name__istartswith=query) |
-            Q(sub_category__category__name__istartswith=query) |
-            Q(sizes__size__istartswith=query) |
-            Q(name__icontains=query) & ~Q(name__istartswith=query) |
-            Q(sub_category__name__icontains=query) & ~Q(sub_category__name__istartswith=query) |
-            Q(sub_category__category__name__icontains=query) & ~Q(sub_category__category__name__istartswith=query) |
-            Q(sizes__size__icontains=query) & ~Q(sizes__size__istartswith=query)
-        ).values('name', 'sub_category__name', 'sub_category__category__name', 'sizes__size').distinct()[:40]
-
-        starts_with = set()
-        contains = set()
-        query_lower = query.lower()
-        for value in chain.from_iterable(row.values() for row in products):
-            if value:
-                value_lower = value.lower()
-                if value_lower.startswith(query_lower):
-                    starts_with.add(value)
-                elif query_lower in value_lower:
-                    contains.add(value)
-            if len(starts_with) + len(contains) >= 20:
-                break
-
-        suggestions = (sorted(starts_with) + sorted(contains))[:20]
-        cache.set(cache_key, suggestions, cache_timeout)
+        suggestions = autocomplete_index.suggest(query)
         return Response(suggestions)
 
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter('sub_category_id', openapi.IN_QUERY, description="Primary Subcategory ID for suggestions", type=openapi.TYPE_INTEGER),
         openapi.Parameter('second_sub_category_id', openapi.IN_QUERY, description="Secondary Subcategory ID for suggestions", type=openapi.TYPE_INTEGER),
         openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max: 20)", type=openapi.TYPE_INTEGER),], operation_id="Product Suggestions", operation_description="Get product suggestions based on subcategory priority, with optional secondary subcategory", tags=["Product"])
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Items per page (max: 20)", type=openapi.TYPE_INTEGER), *PRODUCT_FIELDSET_PARAMS], operation_id="Product Suggestions", operation_description="Get product suggestions based on subcategory priority, with optional secondary subcategory", tags=["Product"])
     @action(detail=False, methods=['get'], url_path='suggestions')
     def suggestions(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"product_suggestions:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
+        cache_key = query_cache_key(request, self, "product_suggestions")
+        return cached_response(request, cache_key, lambda: self.suggestion_results(request), TIMEOUT,
+                               generation=cache.get_generation('catalog'), admit=lambda: admit_variant(request, self, "product_suggestions"))
 
+    def suggestion_results(self, request):
         sub_category_id = request.query_params.get('sub_category_id')
         second_sub_category_id = request.query_params.get('second_sub_category_id')
-        products = Product.objects.select_related('sub_category__category')
-        max_items = 20
-
-        ordering = [
-            Case(When(top_selling_items=True, then=Value(0)), default=Value(1), output_field=BooleanField()),
-            Case(When(latest_item=True, then=Value(0)), default=Value(1), output_field=BooleanField()),
-        ]
+        products = self.get_queryset()
 
         if not sub_category_id and not second_sub_category_id:
-            all_products = products.order_by("top_selling_position", "latest_item_position")[:max_items]
-            final_products = list(all_products)
+            final_products = list(products.order_by("top_selling_position", "latest_item_position")[:SUGGESTION_LIMIT])
 
         else:
             try:
-                priority_pools = []
-                used_category_ids = set()
-                selected_product_ids = set()
-
-                if sub_category_id:
-                    sub_category_id = int(sub_category_id)
-                    target_subcategory = ProductSubCategory.objects.get(id=sub_category_id)
-                    target_category = target_subcategory.category
-                    used_category_ids.add(target_category.id)
-                    priority_pools.append({
-                        'products': list(products.filter(sub_category_id=sub_category_id).order_by(*ordering)),
-                        'weight': 0.4
-                    })
-                    priority_pools.append({
-                        'products': list(products.filter(sub_category__category=target_category)
-                                         .exclude(sub_category_id=sub_category_id).order_by(*ordering)),
-                        'weight': 0.2
-                    })
-
-                if second_sub_category_id:
-                    second_sub_category_id = int(second_sub_category_id)
-                    if sub_category_id and sub_category_id == second_sub_category_id:
-                        second_sub_category_id = None
-                    else:
-                        second_target_subcategory = ProductSubCategory.objects.get(id=second_sub_category_id)
-                        second_target_category = second_target_subcategory.category
-                        used_category_ids.add(second_target_category.id)
-                        priority_pools.append({
-                            'products': list(
-                                products.filter(sub_category_id=second_sub_category_id).order_by(*ordering)),
-                            'weight': 0.25
-                        })
-                        priority_pools.append({
-                            'products': list(products.filter(sub_category__category=second_target_category)
-                                             .exclude(sub_category_id=second_sub_category_id).order_by(*ordering)),
-                            'weight': 0.1
-                        })
-
-                priority_pools.append({
-                    'products': list(
-                        products.exclude(sub_category__category__in=used_category_ids).order_by(*ordering)),
-                    'weight': 0.05
-                })
-
-                priority_pools = [pool for pool in priority_pools if pool['products']]
-                total_weight = sum(pool['weight'] for pool in priority_pools)
-                if total_weight > 0:
-                    for pool in priority_pools:
-                        pool['weight'] /= total_weight
-
-                final_products = []
-                while len(final_products) < max_items and any(pool['products'] for pool in priority_pools):
-                    rand = random.random()
-                    cumulative_weight = 0
-                    selected_pool = None
-                    for pool in priority_pools:
-                        if not pool['products']:
-                            continue
-                        cumulative_weight += pool['weight']
-                        if rand <= cumulative_weight:
-                            selected_pool = pool
-                            break
-                    if not selected_pool:
-                        selected_pool = next((pool for pool in priority_pools if pool['products']), None)
-                    if not selected_pool:
-                        break
-
-                    selected_pool['products'] = [p for p in selected_pool['products'] if
-                                                 p.id not in selected_product_ids]
-                    if not selected_pool['products']:
-                        continue
-
-                    product = selected_pool['products'].pop(0)
-                    selected_product_ids.add(product.id)
-                    final_products.append(product)
-
-                if len(final_products) < max_items:
-                    remaining_products = list(
-                        products.exclude(id__in=selected_product_ids).order_by('?')[:max_items - len(final_products)])
-                    final_products.extend(remaining_products)
-
-                final_products = final_products[:max_items]
-
+                pools = SuggestionPools()
+                product_ids = weighted_interleave(pools.weighted(int(sub_category_id) if sub_category_id else None,
+                                                                 int(second_sub_category_id) if second_sub_category_id else None))
             except (ProductSubCategory.DoesNotExist, ValueError):
-                final_products = list(products.order_by('?')[:max_items])
+                product_ids = pools.sample()
+            selected = products.in_bulk(product_ids)
+            final_products = [selected[product_id] for product_id in product_ids if product_id in selected]
 
         paginator = self.pagination_class()
         page = paginator.paginate_queryset(final_products, request, view=self)
@@ -541,9 +351,7 @@ class ApiProduct(viewsets.ModelViewSet):
         else:
             serializer = self.get_serializer(final_products, many=True)
             response_data = serializer.data
-
-        cache.set(cache_key, response_data, cache_timeout)
-        return Response(response_data, status=status.HTTP_200_OK)
+        return response_data
 
 
 class ApiProductSize(viewsets.ModelViewSet):
@@ -553,6 +361,7 @@ class ApiProductSize(viewsets.ModelViewSet):
     filterset_fields = ["product"]
     search_fields = ["size"]
     ordering_fields = ["quantity"]
+    cache_max_age = {"list": 30, "retrieve": 30}
 
     def get_queryset(self):
         product_id = self.kwargs.get('item_pk')
@@ -565,66 +374,37 @@ class ApiProductSize(viewsets.ModelViewSet):
 
     @swagger_helper(tags="ProductSize", model="Product size")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"product_size_list:{json.dumps(cache_params, sort_keys=True)}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "product_size_list", self.kwargs['item_pk'])
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"product:{self.kwargs['item_pk']}"], admit=lambda: admit_variant(request, self, "product_size_list"))
 
     @swagger_helper(tags="ProductSize", model="Product size")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         cache_key = f"product_size_detail:{kwargs['pk']}"
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"product:{self.kwargs['item_pk']}"])
 
     @swagger_helper(tags="ProductSize", model="Product size")
     def create(self, *args, **kwargs):
         response = super().create(*args, **kwargs)
-        cache.delete_pattern("product_size_list:*")
-        cache.delete_pattern("product_size_detail:*")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("product_detail:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags([f"product:{self.kwargs['item_pk']}"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductSize", model="Product size")
     def partial_update(self, *args, **kwargs):
         response = super().partial_update(*args, **kwargs)
-        cache.delete_pattern("product_size_list:*")
-        cache.delete_pattern(f"product_size_detail:{kwargs['pk']}")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("product_detail:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags([f"product:{self.kwargs['item_pk']}"])
+        cache.bump_generation("catalog")
         return response
 
     @swagger_helper(tags="ProductSize", model="Product size")
     def destroy(self, *args, **kwargs):
         response = super().destroy(*args, **kwargs)
-        cache.delete_pattern("product_size_list:*")
-        cache.delete_pattern(f"product_size_detail:{kwargs['pk']}")
-        cache.delete_pattern("product_list:*")
-        cache.delete_pattern("product_detail:*")
-        cache.delete_pattern("search:*")
-        cache.delete_pattern("search_suggestions:*")
-        cache.delete_pattern("product_suggestions:*")
-        cache.delete_pattern("product_homepage:*")
+        cache.invalidate_tags([f"product:{self.kwargs['item_pk']}"])
+        cache.bump_generation("catalog")
         return response
 
     def perform_create(self, serializer):
@@ -7,7 +7,8 @@ from .models import Wishlist
 from .pagination import CustomPagination
 from .utils import swagger_helper
 from django.core.cache import cache
-import json
+from config.cache_keys import query_cache_key, admit_variant
+from config.response_cache import cached_response
 
 TIMEOUT = int(settings.CACHE_TIMEOUT)
 
@@ -27,43 +28,29 @@ class ApiWishlist(ModelViewSet):
 
     @swagger_helper("Wishlist", "wishlist")
     def list(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
-        cache_params = dict(request.query_params)
-        cache_key = f"wishlist_list:{request.user.id}:{json.dumps(cache_params, sort_keys=True)}"
-
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        cache_key = query_cache_key(request, self, "wishlist_list", request.user.id)
+        parent_list = super().list
+        return cached_response(request, cache_key, lambda: parent_list(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"wishlist:{request.user.id}", "wishlists"], admit=lambda: admit_variant(request, self, "wishlist_list", request.user.id))
 
     @swagger_helper("Wishlist", "wishlist")
     def retrieve(self, request, *args, **kwargs):
-        cache_timeout = TIMEOUT
         wishlist_pk = kwargs["pk"]
         cache_key = f"wishlist_detail:{request.user.id}:{wishlist_pk}"
-
-        cached_response = cache.get(cache_key)
-        if cached_response:
-            return Response(cached_response)
-
-        response = super().retrieve(request, *args, **kwargs)
-        cache.set(cache_key, response.data, cache_timeout)
-        return response
+        parent_retrieve = super().retrieve
+        return cached_response(request, cache_key, lambda: parent_retrieve(request, *args, **kwargs).data, TIMEOUT,
+                               tags=[f"wishlist:{request.user.id}", "wishlists"])
 
     @swagger_helper("Wishlist", "wishlist")
     def create(self, *args, **kwargs):
         response = super().create(*args, **kwargs)
-        cache.delete_pattern(f"wishlist_list:{self.request.user.id}:*")
+        cache.invalidate_tags([f"wishlist:{self.request.user.id}"])
         return response
 
     @swagger_helper("Wishlist", "wishlist")
     def destroy(self, *args, **kwargs):
         response = super().destroy(*args, **kwargs)
-        cache.delete_pattern(f"wishlist_list:{self.request.user.id}:*")
-        cache.delete_pattern(f"wishlist_detail:{self.request.user.id}:{kwargs['pk']}")
+        cache.invalidate_tags([f"wishlist:{self.request.user.id}"])
         return response
 
     def perform_create(self, serializer):
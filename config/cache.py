@@ -1,13 +1,32 @@
-from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
 from django_redis.cache import RedisCache
+from django_redis.exceptions import ConnectionInterrupted
 from django.core.cache.backends.locmem import LocMemCache
-from django_redis import get_redis_connection
 import redis
 import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from .cache_metrics import CacheMetrics
 from fnmatch import fnmatch
 
 logger = logging.getLogger(__name__)
 
+# errors that mean Redis itself is unreachable, as opposed to a bad command
+REDIS_DOWN_ERRORS = (ConnectionInterrupted, redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+# passed as the default to backend get() so a cached None still counts as a hit
+MISSING = object()
+
+# delete a lock only while it still holds the caller's token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 
 class FallbackCache(BaseCache):
     def __init__(self, location, params):
@@ -15,134 +34,449 @@ class FallbackCache(BaseCache):
         self.options = params.get('OPTIONS', {})
         self.redis_config = self.options.get('REDIS_BACKEND', {})
         self.fallback_config = self.options.get('FALLBACK_BACKEND', {})
-        self.backend = self._get_backend()
-        self.is_redis = isinstance(self.backend, RedisCache)
-        self.tracking_key = 'locmem_key_list'
+        self.health_check_interval = self.options.get('HEALTH_CHECK_INTERVAL', 30)
+        self.failure_threshold = self.options.get('FAILURE_THRESHOLD', 1)
+        self.metrics = CacheMetrics(sample_rate=self.options.get('METRICS_SAMPLE_RATE', 0.01))
+        self.stale_ttl = self.options.get('STALE_TTL', 60)
+        self.rebuild_lock_timeout = self.options.get('REBUILD_LOCK_TIMEOUT', 10)
+        self.max_pending_keys = self.options.get('MAX_PENDING_KEYS', 10000)
+        self.redis_cache = RedisCache(
+            server=self.redis_config.get('LOCATION', 'redis://127.0.0.1:6379/1'),
+            params={
+                'OPTIONS': self.redis_config.get('OPTIONS', {})
+            }
+        )
+        self.fallback_cache = LocMemCache(
+            name=self.fallback_config.get('LOCATION', 'fallback-cache'),
+            params={}
+        )
+        self.is_redis = False
+        self.failures = 0
+        self.next_probe = 0
+        self.switch_counts = {'promoted': 0, 'demoted': 0}
+        self.state_lock = threading.Lock()
+        self.key_index = defaultdict(set)
+        self.tag_index = defaultdict(set)
+        self.index_lock = threading.Lock()
+        self.release_mutex = threading.Lock()
+        # invalidations made while on LocMemCache, replayed against Redis when it comes back
+        self.pending_invalidations = {'keys': set(), 'patterns': set(), 'tags': set(), 'generations': set()}
+        self.probed = False
+        self._probe()
+
+    @property
+    def backend(self):
+        if not self.is_redis and time.monotonic() >= self.next_probe:
+            self._probe()
+        return self.redis_cache if self.is_redis else self.fallback_cache
 
-    def _get_backend(self):
+    def health(self):
+        return {
+            'backend': 'redis' if self.is_redis else 'locmem',
+            'failures': self.failures,
+            'promoted': self.switch_counts['promoted'],
+            'demoted': self.switch_counts['demoted'],
+            'next_probe_in': max(0.0, self.next_probe - time.monotonic()) if not self.is_redis else None,
+        }
+
+    def _probe(self):
+        # only one thread probes; the others keep serving from LocMemCache meanwhile
+        if not self.state_lock.acquire(blocking=False):
+            return
         try:
-            redis_cache = RedisCache(
-                server=self.redis_config.get('LOCATION', 'redis://127.0.0.1:6379/1'),
-                params={
-                    'OPTIONS': self.redis_config.get('OPTIONS', {})
-                }
-            )
-            redis_cache.get('test_key')
+            if self.is_redis or time.monotonic() < self.next_probe:
+                return
+            try:
+                self.redis_cache.client.get_client(write=True).ping()
+                self._replay_pending_invalidations()
+            except (REDIS_DOWN_ERRORS + (redis.exceptions.RedisError,)) as e:
+                self.next_probe = time.monotonic() + self.health_check_interval
+                if not self.probed:
+                    logger.info(f"Falling back to LocMemCache due to: {e}")
+                else:
+                    logger.debug("Redis health probe failed: %s", e)
+                self.probed = True
+                return
+            self._promote()
+        finally:
+            self.state_lock.release()
+
+    def _promote(self):
+        if self.probed:
+            logger.warning("Redis cache backend recovered, promoting it from LocMemCache")
+            self.switch_counts['promoted'] += 1
+        else:
             logger.info("Using Redis cache backend")
-            return redis_cache
-        except (redis.exceptions.ConnectionError, redis.exceptions.RedisError, KeyError, Exception) as e:
-            logger.info(f"Falling back to LocMemCache due to: {e}")
-            return LocMemCache(
-                name=self.fallback_config.get('LOCATION', 'fallback-cache'),
-                params={}
-            )
+        self.probed = True
+        self.fallback_cache.clear()
+        with self.index_lock:
+            self.key_index.clear()
+            self.tag_index.clear()
+        self.failures = 0
+        self.is_redis = True
+
+    def _record_failure(self, error):
+        self.failures += 1
+        if self.is_redis and self.failures >= self.failure_threshold:
+            with self.state_lock:
+                if self.is_redis:
+                    self.is_redis = False
+                    self.next_probe = time.monotonic() + self.health_check_interval
+                    self.switch_counts['demoted'] += 1
+                    logger.warning(f"Redis cache backend unavailable, falling back to LocMemCache: {error}")
+
+    def _replay_pending_invalidations(self):
+        pending = self.pending_invalidations
+        if not any(pending.values()):
+            return
+        conn = self.redis_cache.client.get_client(write=True)
+        if pending['keys']:
+            self.redis_cache.delete_many(list(pending['keys']))
+        for pattern in pending['patterns']:
+            self.redis_cache.delete_pattern(pattern)
+        if pending['tags']:
+            self._invalidate_redis_tags(conn, pending['tags'])
+        for namespace in pending['generations']:
+            conn.incr(self.redis_cache.make_key(self._generation_key(namespace)))
+        self.pending_invalidations = {'keys': set(), 'patterns': set(), 'tags': set(), 'generations': set()}
+
+    def _defer_delete(self, key):
+        """Remember a key deleted on LocMemCache for the replay; past MAX_PENDING_KEYS its whole prefix is replayed."""
+        pending = self.pending_invalidations
+        if len(pending['keys']) < self.max_pending_keys:
+            pending['keys'].add(key)
+            return
+        prefix = self._key_prefix(key)
+        pending['patterns'].add(f"{prefix}:*" if prefix is not None and ':' in key else key)
+
+    def _call(self, method, *args, **kwargs):
+        if not self.metrics.should_sample():
+            return self._dispatch(method, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self._dispatch(method, *args, **kwargs)
+        finally:
+            self.metrics.observe(method, time.perf_counter() - start)
+
+    def _dispatch(self, method, *args, **kwargs):
+        backend = self.backend
+        try:
+            result = getattr(backend, method)(*args, **kwargs)
+        except REDIS_DOWN_ERRORS as e:
+            if backend is not self.redis_cache:
+                raise
+            self._record_failure(e)
+            if self.is_redis:
+                raise
+            return getattr(self.fallback_cache, method)(*args, **kwargs)
+        if backend is self.redis_cache:
+            self.failures = 0
+        return result
+
+    def _redis_client(self):
+        return self.redis_cache.client.get_client(write=True)
 
     def add(self, *args, **kwargs):
         key = args[0] if args else kwargs.get('key')
-        logger.info(f"CACHE ADD: key={key}")
-        result = self.backend.add(*args, **kwargs)
-        if not self.is_redis and result:
-            self._track_key(key)
+        logger.debug("CACHE ADD: key=%s", key)
+        result = self._call('add', *args, **kwargs)
+        if result:
+            self.metrics.count(self._key_prefix(key), 'sets')
+            if not self.is_redis:
+                self._track_key(key)
         return result
 
-    def get(self, *args, **kwargs):
-        key = args[0] if args else kwargs.get('key')
-        logger.info(f"CACHE GET: key={key}")
-        return self.backend.get(*args, **kwargs)
+    def get(self, key, default=None, version=None):
+        logger.debug("CACHE GET: key=%s", key)
+        value = self._call('get', key, MISSING, version=version)
+        if value is MISSING:
+            self.metrics.count(self._key_prefix(key), 'misses')
+            return default
+        self.metrics.count(self._key_prefix(key), 'hits')
+        return value
 
-    def set(self, *args, **kwargs):
+    def set(self, *args, tags=None, **kwargs):
         key = args[0] if args else kwargs.get('key')
-        logger.info(f"CACHE SET: key={key}")
-        result = self.backend.set(*args, **kwargs)
+        logger.debug("CACHE SET: key=%s", key)
+        result = self._call('set', *args, **kwargs)
+        self.metrics.count(self._key_prefix(key), 'sets')
         if not self.is_redis:
             self._track_key(key)
+        if tags:
+            timeout = args[2] if len(args) > 2 else kwargs.get('timeout', DEFAULT_TIMEOUT)
+            if timeout is DEFAULT_TIMEOUT:
+                timeout = self.backend.default_timeout
+            self._tag_key(key, tags, timeout)
         return result
 
     def delete(self, *args, **kwargs):
         key = args[0] if args else kwargs.get('key')
-        logger.info(f"CACHE DELETE: key={key}")
-        result = self.backend.delete(*args, **kwargs)
-        if not self.is_redis and result:
-            self._untrack_key(key)
+        logger.debug("CACHE DELETE: key=%s", key)
+        result = self._call('delete', *args, **kwargs)
+        self.metrics.count(self._key_prefix(key), 'deletes')
+        if not self.is_redis:
+            self._defer_delete(key)
+            if result:
+                self._untrack_key(key)
         return result
 
     def clear(self, *args, **kwargs):
-        logger.info("CACHE CLEAR")
-        result = self.backend.clear(*args, **kwargs)
+        logger.debug("CACHE CLEAR")
+        result = self._call('clear', *args, **kwargs)
         if not self.is_redis:
-            self.backend.set(self.tracking_key, [], None)
+            with self.index_lock:
+                self.key_index.clear()
+                self.tag_index.clear()
         return result
 
     def get_many(self, *args, **kwargs):
-        logger.info(f"CACHE GET_MANY: keys={args[0] if args else kwargs.get('keys')}")
-        return self.backend.get_many(*args, **kwargs)
+        keys = list(args[0] if args else kwargs.get('keys', []))
+        logger.debug("CACHE GET_MANY: keys=%s", keys)
+        result = self._call('get_many', keys, *args[1:], **{k: v for k, v in kwargs.items() if k != 'keys'})
+        for key in keys:
+            self.metrics.count(self._key_prefix(key), 'hits' if key in result else 'misses')
+        return result
 
     def set_many(self, *args, **kwargs):
         data = args[0] if args else kwargs.get('data', {})
-        keys = list(data.keys())
-        logger.info(f"CACHE SET_MANY: keys={keys}")
-        result = self.backend.set_many(*args, **kwargs)
-        if not self.is_redis:
-            for key in keys:
+        logger.debug("CACHE SET_MANY: keys=%s", data.keys())
+        result = self._call('set_many', *args, **kwargs)
+        for key in data:
+            self.metrics.count(self._key_prefix(key), 'sets')
+            if not self.is_redis:
                 self._track_key(key)
         return result
 
     def delete_many(self, *args, **kwargs):
-        keys = args[0] if args else kwargs.get('keys', [])
-        logger.info(f"CACHE DELETE_MANY: keys={keys}")
-        result = self.backend.delete_many(*args, **kwargs)
-        if not self.is_redis:
-            for key in keys:
+        keys = list(args[0] if args else kwargs.get('keys', []))
+        logger.debug("CACHE DELETE_MANY: keys=%s", keys)
+        result = self._call('delete_many', keys, *args[1:], **{k: v for k, v in kwargs.items() if k != 'keys'})
+        for key in keys:
+            self.metrics.count(self._key_prefix(key), 'deletes')
+            if not self.is_redis:
+                self._defer_delete(key)
                 self._untrack_key(key)
         return result
 
     def incr(self, *args, **kwargs):
-        logger.info(f"CACHE INCR: key={args[0] if args else kwargs.get('key')}")
-        return self.backend.incr(*args, **kwargs)
+        logger.debug("CACHE INCR: key=%s", args[0] if args else kwargs.get('key'))
+        return self._call('incr', *args, **kwargs)
 
     def decr(self, *args, **kwargs):
-        logger.info(f"CACHE DECR: key={args[0] if args else kwargs.get('key')}")
-        return self.backend.decr(*args, **kwargs)
+        logger.debug("CACHE DECR: key=%s", args[0] if args else kwargs.get('key'))
+        return self._call('decr', *args, **kwargs)
 
     def has_key(self, *args, **kwargs):
-        logger.info(f"CACHE HAS_KEY: key={args[0] if args else kwargs.get('key')}")
-        return self.backend.has_key(*args, **kwargs)
+        logger.debug("CACHE HAS_KEY: key=%s", args[0] if args else kwargs.get('key'))
+        return self._call('has_key', *args, **kwargs)
 
     def close(self, *args, **kwargs):
         return self.backend.close(*args, **kwargs)
 
     def delete_pattern(self, pattern, *args, **kwargs):
-        logger.info(f"CACHE DELETE_PATTERN: pattern={pattern}")
+        logger.debug("CACHE DELETE_PATTERN: pattern=%s", pattern)
         if self.is_redis:
             try:
-                conn = get_redis_connection('default')
-                keys = conn.keys(pattern)
-                if keys:
-                    conn.delete(*keys)
-                logger.debug(f"Deleted Redis cache keys matching pattern: {pattern}")
-            except (redis.exceptions.ConnectionError, redis.exceptions.RedisError) as e:
+                self.redis_cache.delete_pattern(pattern)
+                logger.debug("Deleted Redis cache keys matching pattern: %s", pattern)
+                return
+            except REDIS_DOWN_ERRORS as e:
+                self._record_failure(e)
                 logger.warning(f"Redis error during delete_pattern: {e}")
-        else:
-            key_list = self.backend.get(self.tracking_key, [])
-            keys_to_delete = [key for key in key_list if fnmatch(key, pattern)]
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Redis error during delete_pattern: {e}")
+                return
+            if self.is_redis:
+                return
+        self.pending_invalidations['patterns'].add(pattern)
+        prefix = self._key_prefix(pattern)
+        with self.index_lock:
+            buckets = [prefix] if prefix is not None else list(self.key_index)
+            keys_to_delete = [key for bucket in buckets for key in self.key_index.get(bucket, ()) if fnmatch(key, pattern)]
             for key in keys_to_delete:
-                self.backend.delete(key)
-                key_list.remove(key)
-            self.backend.set(self.tracking_key, key_list, None)
-            logger.debug(f"Deleted LocMemCache keys matching pattern: {pattern}")
+                self.key_index[self._key_prefix(key)].discard(key)
+        for key in keys_to_delete:
+            self.fallback_cache.delete(key)
+        logger.debug("Deleted LocMemCache keys matching pattern: %s", pattern)
+
+    def get_generation(self, namespace):
+        """Current generation of a key namespace. Keys that embed it are retired together by bump_generation()."""
+        return self._call('get', self._generation_key(namespace)) or 0
+
+    def bump_generation(self, namespace):
+        """Retire every key built from the namespace's current generation with a single INCR; old entries age out by TTL."""
+        logger.debug("CACHE BUMP_GENERATION: namespace=%s", namespace)
+        key = self._generation_key(namespace)
+        if self.is_redis:
+            try:
+                return self._redis_client().incr(self.redis_cache.make_key(key))
+            except REDIS_DOWN_ERRORS as e:
+                self._record_failure(e)
+                logger.warning(f"Redis error during bump_generation: {e}")
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Redis error during bump_generation: {e}")
+                return None
+            if self.is_redis:
+                return None
+        self.pending_invalidations['generations'].add(namespace)
+        self.fallback_cache.add(key, 0, None)
+        return self.fallback_cache.incr(key)
+
+    def _generation_key(self, namespace):
+        return f"generation:{namespace}"
+
+    def acquire_lock(self, key, timeout):
+        """Take a lock that expires after `timeout` seconds. Returns the token to release it with, or None if it is held."""
+        token = uuid.uuid4().hex
+        return token if self.add(key, token, timeout) else None
+
+    def release_lock(self, key, token):
+        """Release a lock only while it is still ours, never one that expired and was taken by another caller."""
+        logger.debug("CACHE RELEASE_LOCK: key=%s", key)
+        if self.is_redis:
+            try:
+                full_key = self.redis_cache.make_key(key)
+                return bool(self._redis_client().eval(RELEASE_LOCK_SCRIPT, 1, full_key, self.redis_cache.client.encode(token)))
+            except REDIS_DOWN_ERRORS as e:
+                self._record_failure(e)
+                logger.warning(f"Redis error during release_lock: {e}")
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Redis error during release_lock: {e}")
+                return False
+            if self.is_redis:
+                return False
+        with self.release_mutex:
+            if self.fallback_cache.get(key) != token:
+                return False
+            return self.fallback_cache.delete(key)
+
+    def get_or_compute(self, key, compute, timeout=DEFAULT_TIMEOUT, generation=None, tags=None, admit=None):
+        """
+        Single-flight read-through caching with stale-while-revalidate.
+
+        An entry is fresh for `timeout` seconds while it was built for `generation`, and is kept STALE_TTL longer.
+        On a stale or missing entry one caller takes a short lock and recomputes; the others get the stale value,
+        or wait for the rebuild when there is none, taking the lock over if it lapses first. `admit` is asked
+        before a brand-new entry is stored.
+        """
+        envelope = self._envelope(self.get(key))
+        if self._is_fresh(envelope, generation):
+            return envelope['value']
+        lock_key = f"rebuild_lock:{key}"
+        lock = self.acquire_lock(lock_key, self.rebuild_lock_timeout)
+        if lock is None and envelope is not None:
+            return envelope['value']
+        while lock is None:
+            time.sleep(0.05)
+            # free again once the rebuilding caller stored its value, failed, or ran past REBUILD_LOCK_TIMEOUT
+            lock = self.acquire_lock(lock_key, self.rebuild_lock_timeout)
+            envelope = self._envelope(self.get(key))
+            if self._is_fresh(envelope, generation):
+                if lock is not None:
+                    self.release_lock(lock_key, lock)
+                return envelope['value']
+        try:
+            value = compute()
+            if envelope is not None or admit is None or admit():
+                self.set_fresh(key, value, timeout, generation=generation, tags=tags)
+            return value
+        finally:
+            self.release_lock(lock_key, lock)
+
+    def set_fresh(self, key, value, timeout=DEFAULT_TIMEOUT, generation=None, tags=None):
+        """Store a value for get_or_compute(), readable as stale for STALE_TTL seconds after it stops being fresh."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.backend.default_timeout
+        envelope = {'value': value, 'generation': generation, 'fresh_until': None if timeout is None else time.time() + timeout}
+        self.set(key, envelope, None if timeout is None else timeout + self.stale_ttl, tags=tags)
+
+    def _envelope(self, entry):
+        # entries written by a plain set() under the same key are treated as missing
+        return entry if isinstance(entry, dict) and 'fresh_until' in entry else None
+
+    def _is_fresh(self, envelope, generation):
+        if envelope is None or envelope['generation'] != generation:
+            return False
+        return envelope['fresh_until'] is None or time.time() < envelope['fresh_until']
+
+    def invalidate_tags(self, tags):
+        """Delete every key stored with any of the given tags, costing O(keys in tag) instead of a keyspace scan."""
+        logger.debug("CACHE INVALIDATE_TAGS: tags=%s", tags)
+        if self.is_redis:
+            try:
+                self._invalidate_redis_tags(self._redis_client(), tags)
+                return
+            except REDIS_DOWN_ERRORS as e:
+                self._record_failure(e)
+                logger.warning(f"Redis error during invalidate_tags: {e}")
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Redis error during invalidate_tags: {e}")
+                return
+            if self.is_redis:
+                return
+        self.pending_invalidations['tags'].update(tags)
+        with self.index_lock:
+            keys = set().union(*(self.tag_index.pop(tag, set()) for tag in tags))
+        for key in keys:
+            self.fallback_cache.delete(key)
+            self._untrack_key(key)
+
+    def _invalidate_redis_tags(self, conn, tags):
+        tag_keys = [self._tag_name(tag) for tag in tags]
+        pipe = conn.pipeline()
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        keys = set().union(*pipe.execute())
+        pipe = conn.pipeline()
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(*tag_keys)
+        pipe.execute()
+
+    def _tag_name(self, tag):
+        return self.redis_cache.make_key(f"tag:{tag}")
+
+    def _tag_key(self, key, tags, timeout):
+        if self.is_redis:
+            try:
+                conn = self._redis_client()
+                full_key = self.redis_cache.make_key(key)
+                pipe = conn.pipeline()
+                for tag in tags:
+                    tag_key = self._tag_name(tag)
+                    pipe.sadd(tag_key, full_key)
+                    if timeout:
+                        pipe.expire(tag_key, int(timeout))
+                pipe.execute()
+                return
+            except REDIS_DOWN_ERRORS as e:
+                self._record_failure(e)
+                logger.warning(f"Redis error while tagging cache key: {e}")
+            except redis.exceptions.RedisError as e:
+                logger.warning(f"Redis error while tagging cache key: {e}")
+            return
+        with self.index_lock:
+            for tag in tags:
+                self.tag_index[tag].add(key)
+
+    def _key_prefix(self, key):
+        """Index bucket for a key or pattern: the text before the first ':', or None if a wildcard comes first."""
+        prefix = key.partition(':')[0]
+        if any(char in prefix for char in '*?['):
+            return None
+        return prefix
 
     def _track_key(self, key):
-        if key != self.tracking_key:
-            key_list = self.backend.get(self.tracking_key, [])
-            if key not in key_list:
-                key_list.append(key)
-                self.backend.set(self.tracking_key, key_list, None)
-                logger.debug(f"Tracked LocMemCache key: {key}")
+        prefix = self._key_prefix(key)
+        with self.index_lock:
+            bucket = self.key_index[prefix]
+            bucket.add(key)
+            # LocMemCache culls and expires entries behind our back; prune once a bucket outgrows what it can hold
+            if len(bucket) > 2 * self.fallback_cache._max_entries:
+                self.key_index[prefix] = {k for k in bucket if self.fallback_cache.has_key(k)}
+        logger.debug("Tracked LocMemCache key: %s", key)
 
     def _untrack_key(self, key):
-        if key != self.tracking_key:
-            key_list = self.backend.get(self.tracking_key, [])
-            if key in key_list:
-                key_list.remove(key)
-                self.backend.set(self.tracking_key, key_list, None)
-                logger.debug(f"Untracked LocMemCache key: {key}")
\ No newline at end of file
+        with self.index_lock:
+            self.key_index[self._key_prefix(key)].discard(key)
+        logger.debug("Untracked LocMemCache key: %s", key)
@@ -0,0 +1,89 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+MAX_KEY_LENGTH = 200
+MAX_VARIANTS_PER_VIEW = getattr(settings, "CACHE_MAX_VARIANTS_PER_VIEW", 1000)
+# free-text params: case and spacing do not change the result
+TEXT_PARAMS = {"search", "query"}
+# comma-separated sets: order and repeats do not change the result
+LIST_PARAMS = {"fields"}
+
+
+def allowed_query_params(view):
+    """Query params that can change a response: pagination, the view's filter backends on list, and per-action extras."""
+    allowed = set()
+    paginator = getattr(view, "paginator", None)
+    if paginator is not None:
+        allowed.update(filter(None, [getattr(paginator, "page_query_param", None), getattr(paginator, "page_size_query_param", None)]))
+        if getattr(view, "keyset_ordering", None):
+            allowed.update(["pagination", "cursor", "count"])
+    if getattr(view, "action", None) == "list":
+        for backend in view.filter_backends:
+            if issubclass(backend, SearchFilter) and getattr(view, "search_fields", None):
+                allowed.add(backend.search_param)
+            elif issubclass(backend, OrderingFilter) and getattr(view, "ordering_fields", None):
+                allowed.add(backend.ordering_param)
+            elif issubclass(backend, DjangoFilterBackend):
+                filterset_class = backend().get_filterset_class(view, view.get_queryset())
+                if filterset_class is not None:
+                    allowed.update(filterset_class.base_filters)
+    allowed.update(getattr(view, "cache_query_params", {}).get(getattr(view, "action", None), ()))
+    return allowed
+
+
+def canonical_query(request, view):
+    """Whitelisted params in sorted order, each reduced to the value the view reads; defaults share the bare entry."""
+    paginator = getattr(view, "paginator", None)
+    parts = []
+    for name in sorted(allowed_query_params(view) & set(request.query_params)):
+        # QueryDict.get(), used by DRF and django-filter, reads the last value of a repeated param
+        value = " ".join(request.query_params.getlist(name)[-1].split())
+        if name in TEXT_PARAMS:
+            value = value.lower()
+        if name in LIST_PARAMS:
+            value = ",".join(sorted({item.strip() for item in value.split(",")} - {""}))
+        if name == getattr(paginator, "page_query_param", None) and value == "1":
+            continue
+        if name == getattr(paginator, "page_size_query_param", None):
+            value = canonical_page_size(paginator, value)
+        if value:
+            parts.append(f"{name}={value}")
+    return "&".join(parts)
+
+
+def canonical_page_size(paginator, value):
+    try:
+        page_size = int(value)
+    except ValueError:
+        return ""
+    if page_size <= 0:
+        return ""
+    if paginator.max_page_size:
+        page_size = min(page_size, paginator.max_page_size)
+    return "" if page_size == paginator.page_size else str(page_size)
+
+
+def query_cache_key(request, view, prefix, *scope):
+    """Cache key for a query-param-keyed response, hashed to a fixed length when the canonical form runs long."""
+    key = ":".join([prefix, *map(str, scope), canonical_query(request, view)])
+    if len(key) > MAX_KEY_LENGTH:
+        key = ":".join([prefix, *map(str, scope), "h", hashlib.sha1(key.encode()).hexdigest()])
+    return key
+
+
+def admit_variant(request, view, prefix, *scope):
+    """
+    Count new query-string variants per view and scope (the user, for per-user views) over a CACHE_TIMEOUT window;
+    past the cap they are served uncached. The bare entry, without query params, is always admitted.
+    """
+    if not canonical_query(request, view):
+        return True
+    counter = ":".join(["cache_variants", prefix, *map(str, scope)])
+    cache.add(counter, 0, int(settings.CACHE_TIMEOUT))
+    try:
+        return cache.incr(counter) <= MAX_VARIANTS_PER_VIEW
+    except ValueError:
+        return True
@@ -0,0 +1,50 @@
+import random
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+# upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, float('inf'))
+
+
+class CacheMetrics:
+    """Hit/miss/set/delete counters per key prefix plus sampled per-operation latency histograms."""
+
+    def __init__(self, sample_rate=0.01):
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(lambda: {'hits': 0, 'misses': 0, 'sets': 0, 'deletes': 0})
+            self.latencies = defaultdict(lambda: [0] * len(LATENCY_BUCKETS_MS))
+
+    def should_sample(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def count(self, prefix, counter, amount=1):
+        with self.lock:
+            self.counters[prefix][counter] += amount
+
+    def observe(self, operation, seconds):
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self.lock:
+            self.latencies[operation][bucket] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counters = {prefix: dict(values) for prefix, values in self.counters.items()}
+            latencies = {operation: list(values) for operation, values in self.latencies.items()}
+        for values in counters.values():
+            lookups = values['hits'] + values['misses']
+            values['hit_ratio'] = round(values['hits'] / lookups, 4) if lookups else None
+        labels = [f"le_{bound}ms" if bound != float('inf') else "le_inf" for bound in LATENCY_BUCKETS_MS]
+        return {
+            'sample_rate': self.sample_rate,
+            'counters': counters,
+            'latency_ms': {
+                operation: {'sampled': sum(values), 'buckets': dict(zip(labels, values))}
+                for operation, values in latencies.items()
+            },
+        }
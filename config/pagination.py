@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Seek pagination over a fixed ordering whose last field is unique; every page costs the same query."""
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering, page_size):
+        self.ordering = [(field.lstrip("-"), field.startswith("-")) for field in ordering]
+        self.default_page_size = page_size
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.default_page_size))
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance, reverse):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(instance, name)
+            # dates, datetimes, UUIDs and decimals round-trip through their string form in lookups
+            values.append(value if isinstance(value, (bool, int, float, str, type(None))) else str(value))
+        payload = json.dumps({"v": values, "r": reverse}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = payload["v"], bool(payload["r"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.ordering, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def seek(self, values, reverse):
+        # (a, b, c) after (x, y, z)  ==  a > x  or  (a = x and b > y)  or  (a = x and b = y and c > z)
+        condition = None
+        equal = {}
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = "lt" if descending != reverse else "gt"
+            step = Q(**equal, **{f"{name}__{lookup}": value})
+            condition = step if condition is None else condition | step
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request, queryset.model)
+        self.has_cursor = values is not None
+        ordering = [f"-{name}" if descending != reverse else name for name, descending in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        self.count = self.get_count(queryset, request)
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, reverse))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.has_cursor
+        self.rows = rows
+        return rows
+
+    def get_count(self, queryset, request):
+        """Only on ?count=true, and cached briefly: an approximate total without a COUNT(*) per page."""
+        if request.query_params.get("count") != "true":
+            return None
+        key = f"pagination_count:{hashlib.md5(str(queryset.query).encode()).hexdigest()}"
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, int(settings.CACHE_TIMEOUT))
+        return count
+
+    def get_link(self, instance, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(), "page")
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(instance, reverse))
+
+    def get_next_link(self):
+        return self.get_link(self.rows[-1], False) if self.has_next and self.rows else None
+
+    def get_previous_link(self):
+        return self.get_link(self.rows[0], True) if self.has_previous and self.rows else None
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """Page-number pagination, switching to keyset pagination on ?pagination=cursor for views that set keyset_ordering."""
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    keyset = None
+
+    def wants_keyset(self, queryset, request, view):
+        if not isinstance(queryset, QuerySet) or not getattr(view, "keyset_ordering", None):
+            return False
+        return request.query_params.get("pagination") == "cursor" or KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.wants_keyset(queryset, request, view):
+            self.keyset = KeysetPagination(view.keyset_ordering, self.page_size)
+            self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
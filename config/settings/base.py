@@ -189,7 +189,18 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
 # Task routing
-CELERY_IMPORTS = ('apps.payment.tasks',)
+CELERY_IMPORTS = ('apps.payment.tasks', 'apps.products.tasks')
+
+CELERY_BEAT_SCHEDULE = {
+    'refresh-homepage-feed': {
+        'task': 'apps.products.tasks.refresh_homepage_feed_task',
+        'schedule': 15 * 60,
+    },
+    'requeue-stalled-webhooks': {
+        'task': 'apps.payment.tasks.requeue_stalled_webhooks_task',
+        'schedule': 5 * 60,
+    },
+}
 
 CELERY_WORKER_POOL = 'solo'
 CELERY_WORKER_CONCURRENCY = 1
@@ -213,6 +224,23 @@ PAYMENT_PROVIDERS = {
     }
 }
 
+# in-process provider that approves every payment, for load tests without a network; never enable in production
+if os.getenv("PAYMENT_FAKE_PROVIDER") == "true":
+    PAYMENT_PROVIDERS["fake"] = {
+        "secret_key": os.getenv("PAYMENT_FAKE_SECRET", "fake-secret"),
+        "latency": float(os.getenv("PAYMENT_FAKE_LATENCY", 0)),
+    }
+
+# pooled HTTP client for provider calls (apps/payment/client.py); PAYMENT_PROVIDERS[name]["http"] overrides per provider
+PAYMENT_HTTP = {
+    "connect_timeout": float(os.getenv("PAYMENT_HTTP_CONNECT_TIMEOUT", 3.05)),
+    "read_timeout": float(os.getenv("PAYMENT_HTTP_READ_TIMEOUT", 10)),
+    "retries": int(os.getenv("PAYMENT_HTTP_RETRIES", 2)),
+    "backoff_factor": 0.5,
+    "backoff_jitter": 0.25,
+    "pool_maxsize": int(os.getenv("PAYMENT_HTTP_POOL_SIZE", 10)),
+}
+
 CACHES = {
     'default': {
         'BACKEND': 'config.cache.FallbackCache',
@@ -222,16 +250,31 @@ CACHES = {
                 'LOCATION': 'redis://127.0.0.1:6379/1',
                 'OPTIONS': {
                     'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                    'SOCKET_CONNECT_TIMEOUT': 1,
+                    'SOCKET_TIMEOUT': 1,
                 }
             },
             'FALLBACK_BACKEND': {
                 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
                 'LOCATION': 'fallback-cache',
-            }
+            },
+            'HEALTH_CHECK_INTERVAL': 30,
+            'FAILURE_THRESHOLD': 1,
+            'METRICS_SAMPLE_RATE': 0.01,
+            'STALE_TTL': 60,
+            'REBUILD_LOCK_TIMEOUT': 10,
+            # keys deleted during an outage, past which their prefixes are replayed instead
+            'MAX_PENDING_KEYS': 10000,
         }
     }
 }
 
+# distinct cached query-string variants allowed per view within CACHE_TIMEOUT
+CACHE_MAX_VARIANTS_PER_VIEW = int(os.getenv("CACHE_MAX_VARIANTS_PER_VIEW", 1000))
+
+# dotted path to a class in apps.products.search; picked from the database vendor when unset
+PRODUCT_SEARCH_BACKEND = os.getenv("PRODUCT_SEARCH_BACKEND")
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_HEADERS = ['Authorization', 'Content-Type', 'Accept',]
 CORS_ALLOW_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
\ No newline at end of file
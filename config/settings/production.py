@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 ALLOWED_HOSTS = ["*"]
+PAYMENT_PROVIDERS.pop("fake", None)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
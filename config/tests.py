@@ -0,0 +1,177 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+import fakeredis
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from .cache import FallbackCache
+from .cache_keys import admit_variant
+
+# django-redis keeps one connection pool per URL, so every cache built here talks to this server
+redis_server = fakeredis.FakeServer()
+
+
+class FallbackCacheTests(SimpleTestCase):
+    def setUp(self):
+        redis_server.connected = True
+        self.redis = fakeredis.FakeRedis(server=redis_server, db=1)
+        self.redis.flushall()
+        self.cache = FallbackCache("", {
+            "OPTIONS": {
+                "REDIS_BACKEND": {
+                    "LOCATION": "redis://fake-redis:6379/1",
+                    "OPTIONS": {"CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeConnection, "server": redis_server}},
+                },
+                "FALLBACK_BACKEND": {"LOCATION": f"fallback-{self.id()}"},
+                # probe on every call while on LocMemCache
+                "HEALTH_CHECK_INTERVAL": 0,
+            }
+        })
+
+    def redis_down(self):
+        redis_server.connected = False
+        with self.assertLogs("config.cache", "WARNING") as logs:
+            self.cache.set("probe", 1)
+        self.assertIn("falling back to LocMemCache", logs.output[0])
+
+    def redis_up(self):
+        redis_server.connected = True
+        with self.assertLogs("config.cache", "WARNING") as logs:
+            self.cache.get("probe")
+        self.assertIn("promoting it from LocMemCache", logs.output[0])
+
+    def test_uses_redis_when_reachable(self):
+        self.cache.set("product:1", "shirt", 60)
+        self.assertEqual(self.cache.health()["backend"], "redis")
+        self.assertEqual(self.cache.get("product:1"), "shirt")
+        self.assertTrue(self.redis.exists(self.cache.redis_cache.make_key("product:1")))
+
+    def test_falls_back_to_locmem_when_redis_fails(self):
+        self.redis_down()
+        self.assertEqual(self.cache.health()["backend"], "locmem")
+        self.assertEqual(self.cache.switch_counts["demoted"], 1)
+
+        self.cache.set("product:1", "shirt", 60)
+        self.assertEqual(self.cache.get("product:1"), "shirt")
+        self.assertEqual(self.cache.get_or_compute("feed:home", lambda: ["shirt"], 60), ["shirt"])
+        self.assertEqual(self.cache.fallback_cache.get("product:1"), "shirt")
+
+    def test_recovery_promotes_redis_and_replays_invalidations(self):
+        self.cache.set("product:1", "shirt", 60)
+        self.cache.set("products:page=1", ["shirt"], 60)
+        self.cache.set("products:page=2", ["hat"], 60)
+        self.cache.set("product_detail:1", {"name": "shirt"}, 60, tags=["product:1"])
+        generation = self.cache.get_generation("catalog")
+
+        self.redis_down()
+        self.cache.delete("product:1")
+        self.cache.delete_pattern("products:*")
+        self.cache.invalidate_tags(["product:1"])
+        self.cache.bump_generation("catalog")
+        self.cache.set("cart:1", "during outage", 60)
+
+        self.redis_up()
+        self.assertEqual(self.cache.health()["backend"], "redis")
+        self.assertEqual(self.cache.switch_counts["promoted"], 1)
+        # Redis still held every entry written before the outage; the replay removed the invalidated ones
+        for key in ("product:1", "products:page=1", "products:page=2", "product_detail:1"):
+            self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.get_generation("catalog"), generation + 1)
+        self.assertFalse(any(self.cache.pending_invalidations.values()))
+        self.assertIsNone(self.cache.fallback_cache.get("cart:1"))
+
+    def test_pending_deletes_past_the_cap_replay_their_prefix(self):
+        self.cache.max_pending_keys = 2
+        for user_id in range(5):
+            self.cache.set(f"cart_list:{user_id}", ["shirt"], 60)
+        self.cache.set("product:1", "shirt", 60)
+
+        self.redis_down()
+        for user_id in range(4):
+            self.cache.delete(f"cart_list:{user_id}")
+        self.assertEqual(len(self.cache.pending_invalidations['keys']), 2)
+        self.assertEqual(self.cache.pending_invalidations['patterns'], {"cart_list:*"})
+
+        self.redis_up()
+        for user_id in range(5):
+            self.assertIsNone(self.cache.get(f"cart_list:{user_id}"))
+        self.assertEqual(self.cache.get("product:1"), "shirt")
+
+    def test_redis_writes_after_recovery_are_kept(self):
+        self.redis_down()
+        self.redis_up()
+        self.cache.set("product:1", "shirt", 60)
+        self.assertEqual(self.cache.health()["backend"], "redis")
+        self.assertEqual(self.cache.get("product:1"), "shirt")
+        self.assertTrue(self.redis.exists(self.cache.redis_cache.make_key("product:1")))
+
+    def test_release_lock_leaves_a_lock_taken_over_by_another_caller(self):
+        for outage in (False, True):
+            if outage:
+                self.redis_down()
+            first = self.cache.acquire_lock("payment_lock:tx-1", 60)
+            self.assertIsNotNone(first)
+            self.assertIsNone(self.cache.acquire_lock("payment_lock:tx-1", 60))
+            # the first holder ran past the timeout and a second caller took the lock
+            self.cache.delete("payment_lock:tx-1")
+            second = self.cache.acquire_lock("payment_lock:tx-1", 60)
+
+            self.assertFalse(self.cache.release_lock("payment_lock:tx-1", first))
+            self.assertIsNone(self.cache.acquire_lock("payment_lock:tx-1", 60))
+            self.assertTrue(self.cache.release_lock("payment_lock:tx-1", second))
+            self.assertIsNotNone(self.cache.acquire_lock("payment_lock:tx-1", 60))
+            self.cache.delete("payment_lock:tx-1")
+
+
+    def test_concurrent_misses_share_one_rebuild(self):
+        rebuilds, results = [], []
+        barrier = threading.Barrier(5)
+
+        def compute():
+            rebuilds.append(1)
+            time.sleep(0.3)
+            return ["shirt"]
+
+        def read():
+            barrier.wait()
+            results.append(self.cache.get_or_compute("feed:home", compute, 60))
+
+        threads = [threading.Thread(target=read) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [["shirt"]] * 5)
+        self.assertEqual(len(rebuilds), 1)
+
+    def test_waiters_take_over_a_lapsed_rebuild_lock(self):
+        self.cache.rebuild_lock_timeout = 1
+        # a caller that died mid-rebuild, leaving its lock to expire
+        abandoned = self.cache.acquire_lock("rebuild_lock:feed:home", 1)
+        self.assertEqual(self.cache.get_or_compute("feed:home", lambda: ["shirt"], 60), ["shirt"])
+        self.assertFalse(self.cache.release_lock("rebuild_lock:feed:home", abandoned))
+        self.assertIsNotNone(self.cache.acquire_lock("rebuild_lock:feed:home", 1))
+
+class AdmitVariantTests(SimpleTestCase):
+    def setUp(self):
+        for scope in ("cart_list:1", "cart_list:2"):
+            self.addCleanup(cache.delete, f"cache_variants:{scope}")
+
+    def admit(self, query, user_id):
+        request = Request(APIRequestFactory().get("/api/v1/cart/", query))
+        view = SimpleNamespace(paginator=PageNumberPagination(), action=None)
+        return admit_variant(request, view, "cart_list", user_id)
+
+    @mock.patch("config.cache_keys.MAX_VARIANTS_PER_VIEW", 2)
+    def test_variants_are_capped_per_scope(self):
+        self.assertTrue(self.admit({"page": 2}, 1))
+        self.assertTrue(self.admit({"page": 3}, 1))
+        self.assertFalse(self.admit({"page": 4}, 1))
+        # another user's variants, and the bare entry, are not held back by user 1's
+        self.assertTrue(self.admit({"page": 2}, 2))
+        self.assertTrue(self.admit({}, 1))
+        self.assertTrue(self.admit({"utm_source": "mail"}, 1))